@@ -0,0 +1,119 @@
+"""
+Cold start and time to first isochrone, each run in a fresh process.
+
+Measures per run: JVM start and imports, loading the transport network, and
+routing the first isochrone (no database involved). With --uncached the
+network cache is deleted before every run, to compare against building the
+network from the PBF (r5py's own network cache is bypassed on that path, so
+these runs are really cold).
+
+    uv run python benchmarks/cold_start.py --runs 3
+    uv run python benchmarks/cold_start.py --runs 3 --uncached
+"""
+import argparse
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from benchmarks.common import summarize
+
+# Münster city centre
+ORIGIN_LON, ORIGIN_LAT = 7.625, 51.962
+PHASES = ["imports", "network_load", "first_isochrone", "total"]
+
+
+def run_once(
+    region: str, mode: str, time_seconds: int, uncached: bool
+) -> dict[str, float]:
+    """One cold start, in this (fresh) process."""
+    start = time.perf_counter()
+    from functions.network_cache import clear_r5py_network_cache, network_cache_path
+    from functions.reachability import get_transport_network, route_travel_time_surface
+    from functions.regions import get_region
+    from functions.surfaces import isochrone_from_surface, surface_max_time
+
+    imported = time.perf_counter()
+    if uncached:
+        pbf_file = get_region(region).find_pbf()
+        network_cache_path(region, pbf_file).unlink(missing_ok=True)
+        clear_r5py_network_cache(pbf_file)
+        imported = time.perf_counter()
+    get_transport_network(region)
+    loaded = time.perf_counter()
+    surface = route_travel_time_surface(
+        region, ORIGIN_LON, ORIGIN_LAT, mode, surface_max_time(time_seconds)
+    )
+    isochrone_from_surface(surface, time_seconds)
+    done = time.perf_counter()
+
+    return {
+        "imports": imported - start,
+        "network_load": loaded - imported,
+        "first_isochrone": done - loaded,
+        "total": done - start,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--region", default="muenster")
+    parser.add_argument("--mode", default="walk", choices=["walk", "bike", "car"])
+    parser.add_argument("--time", type=int, default=900, help="Isochrone time in seconds")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument(
+        "--uncached", action="store_true", help="Delete the network cache before each run"
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_once(args.region, args.mode, args.time, args.uncached)))
+        return
+
+    from functions.regions import get_region
+
+    command = [
+        sys.executable,
+        __file__,
+        "--child",
+        f"--region={args.region}",
+        f"--mode={args.mode}",
+        f"--time={args.time}",
+    ]
+    if args.uncached:
+        command.append("--uncached")
+
+    results = []
+    for _ in range(args.runs):
+        child = subprocess.run(
+            command,
+            check=True,
+            capture_output=True,
+            text=True,
+        )
+        results.append(json.loads(child.stdout.strip().splitlines()[-1]))
+
+    summary = {phase: summarize([r[phase] for r in results]) for phase in PHASES}
+
+    if args.json:
+        print(json.dumps({"runs": results, "summary": summary}, indent=2))
+        return
+
+    pbf_file = get_region(args.region).find_pbf()
+    print(f"{args.region} ({pbf_file.name if pbf_file else 'no .osm.pbf'}), "
+          f"{'uncached' if args.uncached else 'cached'} network, {args.runs} runs")
+    print(f"{'phase':<18}{'median':>10}{'min':>10}{'max':>10}")
+    for phase, stats in summary.items():
+        print(
+            f"{phase:<18}{stats['median']:>9.2f}s{stats['min']:>9.2f}s{stats['max']:>9.2f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
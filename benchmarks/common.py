@@ -0,0 +1,48 @@
+"""
+Helpers shared by the benchmark scripts: the Münster sample area, origin
+sampling, isochrone overlap and latency summaries.
+"""
+import math
+import random
+import statistics
+
+from shapely.geometry import shape
+
+# Münster city area (lon/lat) used to draw origins from
+MUENSTER_BBOX = (7.56, 51.92, 7.70, 52.00)
+
+
+def random_origins(count: int, seed: int) -> list[tuple[float, float]]:
+    """A seeded, reproducible set of origins within MUENSTER_BBOX."""
+    rng = random.Random(seed)
+    min_lon, min_lat, max_lon, max_lat = MUENSTER_BBOX
+    return [
+        (rng.uniform(min_lon, max_lon), rng.uniform(min_lat, max_lat))
+        for _ in range(count)
+    ]
+
+
+def iou(a: dict, b: dict) -> float:
+    """Intersection over union of two GeoJSON geometries."""
+    a, b = shape(a), shape(b)
+    union = a.union(b).area
+    return a.intersection(b).area / union if union else 1.0
+
+
+def percentile(values: list[float], q: float) -> float:
+    """Nearest-rank percentile (q in 0..1), NaN without values."""
+    if not values:
+        return math.nan
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(values: list[float]) -> dict:
+    values = sorted(values)
+    return {
+        "median": statistics.median(values),
+        "p95": percentile(values, 0.95),
+        "min": values[0],
+        "max": values[-1],
+    }
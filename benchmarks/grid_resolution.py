@@ -0,0 +1,132 @@
+"""
+Latency versus accuracy of the r5py destination grid, per mode.
+
+For a seeded set of origins in Münster, each grid policy routes a surface up to
+the time the API routes (SURFACE_MAX_TIME_SECONDS): the fixed grid (100 m,
+sample ratio 0.3) and the adaptive grid for each target destination count.
+Isochrones derived from them are compared (intersection over union) with those
+of a fine reference grid. Needs the region's .osm.pbf and a JVM, no database.
+
+    uv run python benchmarks/grid_resolution.py --origins 10
+    uv run python benchmarks/grid_resolution.py --mode car --target 5000 --target 20000
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from pathlib import Path
+
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from benchmarks.common import iou, random_origins, summarize
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--region", default="muenster")
+    parser.add_argument("--mode", action="append", choices=["walk", "bike", "car"])
+    parser.add_argument("--time", type=int, action="append", help="Isochrone time in seconds")
+    parser.add_argument(
+        "--target",
+        type=int,
+        action="append",
+        help="Target destination count of an adaptive policy (repeatable)",
+    )
+    parser.add_argument(
+        "--reference-resolution",
+        type=float,
+        default=50,
+        help="Grid resolution of the reference in meters, every point routed",
+    )
+    parser.add_argument("--origins", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+    modes = args.mode or ["walk", "bike", "car"]
+    times = args.time or [600, 900]
+
+    # Imported after parsing: r5py adds its own arguments to sys.argv
+    from functions.reachability import (
+        get_transport_network,
+        route_travel_time_surface_r5py,
+    )
+    from functions.surfaces import (
+        POINT_GRID_RESOLUTION,
+        POINT_GRID_SAMPLE_RATIO,
+        POINT_GRID_TARGET_DESTINATIONS,
+        grid_parameters,
+        isochrone_from_surface,
+        surface_max_time,
+    )
+
+    origins = random_origins(args.origins, args.seed)
+    max_time = surface_max_time(max(times))
+    targets = args.target or [POINT_GRID_TARGET_DESTINATIONS]
+
+    get_transport_network(args.region)
+
+    results = {"max_time": max_time, "modes": {}}
+    for mode in modes:
+        policies = {"fixed": (POINT_GRID_RESOLUTION, POINT_GRID_SAMPLE_RATIO)}
+        for target in targets:
+            policies[f"target={target}"] = grid_parameters(mode, max_time, target)
+
+        latency = {name: [] for name in policies}
+        destinations = {name: [] for name in policies}
+        overlap = {name: {t: [] for t in times} for name in policies}
+        for lon, lat in origins:
+            # Routed only as far as the largest time, to keep the fine grid small
+            reference = route_travel_time_surface_r5py(
+                args.region, lon, lat, mode, max(times), args.reference_resolution, 1.0
+            )
+            for name, (resolution, sample_ratio) in policies.items():
+                start = time.perf_counter()
+                surface = route_travel_time_surface_r5py(
+                    args.region, lon, lat, mode, max_time, resolution, sample_ratio
+                )
+                latency[name].append(time.perf_counter() - start)
+                destinations[name].append(len(surface))
+                for t in times:
+                    overlap[name][t].append(
+                        iou(isochrone_from_surface(surface, t), isochrone_from_surface(reference, t))
+                    )
+
+        results["modes"][mode] = {
+            name: {
+                "resolution": resolution,
+                "sample_ratio": round(sample_ratio, 3),
+                "reached_destinations": statistics.median(destinations[name]),
+                "latency": summarize(latency[name]),
+                "iou": {str(t): summarize(v) for t, v in overlap[name].items()},
+            }
+            for name, (resolution, sample_ratio) in policies.items()
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(
+        f"{args.region}, {args.origins} origins, surfaces up to {max_time}s, "
+        f"reference grid {args.reference_resolution:g} m"
+    )
+    iou_header = "".join(f"{'IoU ' + str(t) + 's':>12}" for t in times)
+    for mode, policies in results["modes"].items():
+        print(f"\n{mode}")
+        print(
+            f"  {'policy':<16}{'grid':>12}{'reached':>10}{'median':>10}{'p95':>10}{iou_header}"
+        )
+        for name, result in policies.items():
+            grid = f"{result['resolution']:g}m/{result['sample_ratio']:g}"
+            ious = "".join(f"{result['iou'][str(t)]['median']:>12.3f}" for t in times)
+            print(
+                f"  {name:<16}{grid:>12}{result['reached_destinations']:>10.0f}"
+                f"{result['latency']['median'] * 1e3:>8.0f}ms"
+                f"{result['latency']['p95'] * 1e3:>8.0f}ms{ious}"
+            )
+
+
+if __name__ == "__main__":
+    main()
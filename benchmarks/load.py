@@ -0,0 +1,182 @@
+"""
+End-to-end load generator for the API.
+
+Sends requests with synthetic origins in Münster and reports latency
+percentiles and throughput per endpoint. Run it against the benchmark stack
+(see benchmarks/README.md) or any running instance.
+
+    uv run python benchmarks/load.py --requests 200 --concurrency 8
+    uv run python benchmarks/load.py --endpoint point_to_poi --origins 20
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import httpx
+
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from benchmarks.common import percentile, random_origins
+
+ENDPOINTS = ["point_to_poi", "reachability", "heatmap_pois"]
+MODES = ["walk", "bike", "car"]
+TIMES = [300, 600, 900]
+
+
+@dataclass
+class EndpointStats:
+    latencies: list[float] = field(default_factory=list)
+    errors: int = 0
+    status_codes: dict[int, int] = field(default_factory=dict)
+
+
+def synthetic_origins(count: int, seed: int) -> list[tuple[float, float]]:
+    """
+    A fixed set of origins. Repeating a small set exercises the isochrone
+    cache the same way real traffic around popular places does.
+    """
+    return [
+        (round(lon, 5), round(lat, 5)) for lon, lat in random_origins(count, seed)
+    ]
+
+
+def build_request(endpoint: str, rng: random.Random, origins: list) -> dict:
+    longitude, latitude = rng.choice(origins)
+    params = {
+        "longitude": longitude,
+        "latitude": latitude,
+        "mode": rng.choice(MODES),
+        "time": rng.choice(TIMES),
+    }
+
+    if endpoint == "point_to_poi":
+        return {"method": "POST", "url": "/point_to_poi", "params": params}
+    if endpoint == "reachability":
+        return {"method": "GET", "url": "/reachability", "params": params}
+    return {"method": "GET", "url": "/heatmap_pois"}
+
+
+async def run_load(
+    base_url: str,
+    endpoints: list[str],
+    total_requests: int,
+    concurrency: int,
+    origins: list,
+    seed: int,
+    timeout: float,
+) -> tuple[dict[str, EndpointStats], float]:
+    rng = random.Random(seed)
+    queue: asyncio.Queue = asyncio.Queue()
+    for i in range(total_requests):
+        endpoint = endpoints[i % len(endpoints)]
+        queue.put_nowait((endpoint, build_request(endpoint, rng, origins)))
+
+    stats = {endpoint: EndpointStats() for endpoint in endpoints}
+
+    async def worker(client: httpx.AsyncClient):
+        while not queue.empty():
+            endpoint, request = queue.get_nowait()
+            start = time.perf_counter()
+            try:
+                response = await client.request(**request)
+                await response.aread()
+            except httpx.HTTPError:
+                stats[endpoint].errors += 1
+                continue
+            elapsed = time.perf_counter() - start
+
+            endpoint_stats = stats[endpoint]
+            endpoint_stats.status_codes[response.status_code] = (
+                endpoint_stats.status_codes.get(response.status_code, 0) + 1
+            )
+            if response.status_code >= 400:
+                endpoint_stats.errors += 1
+            else:
+                endpoint_stats.latencies.append(elapsed)
+
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(
+        base_url=base_url, timeout=timeout, limits=limits
+    ) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        duration = time.perf_counter() - start
+
+    return stats, duration
+
+
+def summarize(stats: dict[str, EndpointStats], duration: float) -> dict:
+    summary = {}
+    for endpoint, endpoint_stats in stats.items():
+        latencies = endpoint_stats.latencies
+        summary[endpoint] = {
+            "requests": len(latencies) + endpoint_stats.errors,
+            "errors": endpoint_stats.errors,
+            "status_codes": endpoint_stats.status_codes,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "throughput_rps": len(latencies) / duration if duration else 0.0,
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument(
+        "--endpoint", choices=ENDPOINTS + ["all"], default="all"
+    )
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--origins", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    endpoints = ENDPOINTS if args.endpoint == "all" else [args.endpoint]
+    origins = synthetic_origins(args.origins, args.seed)
+
+    stats, duration = asyncio.run(
+        run_load(
+            args.base_url,
+            endpoints,
+            args.requests,
+            args.concurrency,
+            origins,
+            args.seed,
+            args.timeout,
+        )
+    )
+    summary = summarize(stats, duration)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, {duration:.1f}s")
+    print(
+        f"{'endpoint':<16}{'ok':>6}{'err':>6}"
+        f"{'p50':>11}{'p95':>11}{'p99':>11}{'req/s':>9}"
+    )
+    for endpoint, result in summary.items():
+        print(
+            f"{endpoint:<16}"
+            f"{result['requests'] - result['errors']:>6}{result['errors']:>6}"
+            f"{result['p50_ms']:>9.1f}ms{result['p95_ms']:>9.1f}ms"
+            f"{result['p99_ms']:>9.1f}ms{result['throughput_rps']:>9.2f}"
+        )
+
+    if any(result["errors"] for result in summary.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
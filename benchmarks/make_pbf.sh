@@ -0,0 +1,12 @@
+#!/bin/sh
+# Cut the small benchmark extract (Münster city centre) out of the full
+# Geofabrik extract downloaded by init.sh. Requires osmium-tool.
+set -e
+
+SOURCE_FILE="${1:-./data/muenster/muenster.osm.pbf}"
+BENCH_DIR="./benchmarks/data/muenster"
+BENCH_BBOX="7.56,51.92,7.70,52.00"
+
+mkdir -p "$BENCH_DIR"
+osmium extract --overwrite -b "$BENCH_BBOX" "$SOURCE_FILE" -o "$BENCH_DIR/muenster-bench.osm.pbf"
+echo "Wrote $BENCH_DIR/muenster-bench.osm.pbf"
@@ -0,0 +1,200 @@
+"""
+Micro-benchmarks for the CPU-bound parts of a request.
+
+Uses the recorded response in http_requests/response.json as test data, so no
+database, network or JVM is needed.
+
+    uv run python benchmarks/micro.py
+    uv run python benchmarks/micro.py --save baseline.json
+    uv run python benchmarks/micro.py --compare baseline.json
+"""
+import argparse
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import Callable
+
+import orjson
+import shapely
+from fastapi.encoders import jsonable_encoder
+from shapely.geometry import MultiPoint, Polygon, mapping, shape
+
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from functions.overpass_models import OverpassElement
+from functions.poi import build_default_amenity_state
+from functions.scoring import calculate_score
+from functions.serialization import dumps, round_coordinates
+
+RESPONSE_FILE = root_dir / "http_requests" / "response.json"
+
+# Münster city centre, the origin the recorded response was made for
+ORIGIN_LON, ORIGIN_LAT = 7.625, 51.962
+
+
+def haversine(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    )
+    return 2 * 6371000 * math.asin(math.sqrt(a))
+
+
+def load_fixture() -> dict:
+    with open(RESPONSE_FILE) as f:
+        return json.load(f)
+
+
+def fixture_polygon(fixture: dict) -> Polygon:
+    # The recorded polygon uses the Overpass "lat lon lat lon ..." format
+    values = [float(v) for v in fixture["polygon"].split()]
+    return Polygon(list(zip(values[1::2], values[0::2])))
+
+
+def scored_amenities(fixture: dict) -> list[dict]:
+    """Rows shaped like the output of get_amenities_in_polygon_postgres."""
+    return [
+        {
+            "id": element["id"],
+            "name": element["tags"].get("name"),
+            "amenity": element["tags"].get("amenity"),
+            "cuisine": element["tags"].get("cuisine"),
+            "lat": element["lat"],
+            "lon": element["lon"],
+            "distance": haversine(
+                ORIGIN_LON, ORIGIN_LAT, element["lon"], element["lat"]
+            ),
+        }
+        for element in fixture["amenities"]
+    ]
+
+
+def destination_points(polygon: Polygon, count: int, seed: int) -> list[tuple]:
+    """Random points inside the polygon, standing in for r5py destinations."""
+    rng = random.Random(seed)
+    min_x, min_y, max_x, max_y = polygon.bounds
+    return [
+        (rng.uniform(min_x, max_x), rng.uniform(min_y, max_y)) for _ in range(count)
+    ]
+
+
+def build_benchmarks(seed: int) -> dict[str, Callable[[], object]]:
+    fixture = load_fixture()
+    polygon = fixture_polygon(fixture)
+    amenities = scored_amenities(fixture)
+    amenity_state = build_default_amenity_state()
+    max_distance = max(a["distance"] for a in amenities)
+    points = destination_points(polygon, 5000, seed)
+    hull_geojson = mapping(MultiPoint(points).convex_hull)
+    response = {"amenities": amenities, "score": 5.0, "polygon": hull_geojson}
+    # As stored in the isochrones table
+    hull_bytes = dumps(round_coordinates(hull_geojson))
+    hull_wkb = shapely.to_wkb(shape(round_coordinates(hull_geojson)))
+
+    return {
+        "calculate_score": lambda: calculate_score(
+            amenities=amenities,
+            amenity_state=amenity_state,
+            max_distance=max_distance,
+        ),
+        "overpass_parse": lambda: [
+            OverpassElement.model_validate(element)
+            for element in fixture["amenities"]
+        ],
+        "convex_hull_5000": lambda: MultiPoint(points).convex_hull,
+        "geojson_polygon_dumps": lambda: json.dumps(hull_geojson),
+        "point_to_poi_response": lambda: json.dumps(jsonable_encoder(response)),
+        "point_to_poi_orjson": lambda: dumps(
+            {**response, "polygon": round_coordinates(hull_geojson)}
+        ),
+        "point_to_poi_fragment": lambda: dumps(
+            {**response, "polygon": orjson.Fragment(hull_bytes)}
+        ),
+        "polygon_from_geojson": lambda: shape(orjson.loads(hull_bytes)),
+        "polygon_from_wkb": lambda: shapely.from_wkb(hull_wkb),
+    }
+
+
+def run_benchmark(func: Callable[[], object], repeat: int, min_time: float) -> dict:
+    # Calibrate the number of calls per sample so each sample takes ~min_time
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        if time.perf_counter() - start >= min_time:
+            break
+        number *= 2
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        samples.append((time.perf_counter() - start) / number)
+
+    samples.sort()
+    return {
+        "number": number,
+        "min": samples[0],
+        "median": statistics.median(samples),
+        "p95": samples[min(len(samples) - 1, math.ceil(0.95 * len(samples)) - 1)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--min-time", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--filter", help="Only run benchmarks containing this string")
+    parser.add_argument("--save", type=Path, help="Write results as JSON")
+    parser.add_argument("--compare", type=Path, help="Baseline JSON to compare to")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=1.2,
+        help="Fail if a median is slower than baseline by this factor",
+    )
+    args = parser.parse_args()
+
+    results = {}
+    for name, func in build_benchmarks(args.seed).items():
+        if args.filter and args.filter not in name:
+            continue
+        results[name] = run_benchmark(func, args.repeat, args.min_time)
+
+    baseline = json.loads(args.compare.read_text()) if args.compare else {}
+    regressions = []
+
+    print(f"{'benchmark':<26}{'median':>12}{'p95':>12}{'min':>12}{'vs base':>10}")
+    for name, result in results.items():
+        line = (
+            f"{name:<26}"
+            f"{result['median'] * 1e3:>10.3f}ms"
+            f"{result['p95'] * 1e3:>10.3f}ms"
+            f"{result['min'] * 1e3:>10.3f}ms"
+        )
+        if name in baseline:
+            ratio = result["median"] / baseline[name]["median"]
+            line += f"{ratio:>9.2f}x"
+            if ratio > args.threshold:
+                regressions.append(name)
+        print(line)
+
+    if args.save:
+        args.save.write_text(json.dumps(results, indent=2))
+
+    if regressions:
+        print(f"\nRegressions (> {args.threshold}x baseline): {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
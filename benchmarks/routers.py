@@ -0,0 +1,114 @@
+"""
+Compare the in-process graph router with r5py for walk and bike isochrones.
+
+For a seeded set of origins in Münster, both engines route the same
+destination grid. Reports routing latency, the memory the loaded networks take
+and the overlap (intersection over union) of the resulting isochrones, with
+r5py as reference. Needs the region's .osm.pbf and a JVM, no database.
+
+    uv run python benchmarks/routers.py --origins 20
+    uv run python benchmarks/routers.py --mode walk --time 600 --time 1200
+"""
+import argparse
+import json
+import resource
+import sys
+import time
+from pathlib import Path
+
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from benchmarks.common import iou, random_origins, summarize
+
+
+def max_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--region", default="muenster")
+    parser.add_argument("--mode", action="append", choices=["walk", "bike"])
+    parser.add_argument("--time", type=int, action="append", help="Isochrone time in seconds")
+    parser.add_argument("--origins", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+    modes = args.mode or ["walk", "bike"]
+    times = args.time or [600, 900]
+
+    # Imported after parsing: r5py adds its own arguments to sys.argv
+    import jpype
+    from functions.graph_router import get_street_graph
+    from functions.reachability import (
+        get_transport_network,
+        route_travel_time_surface_r5py,
+    )
+    from functions.surfaces import isochrone_from_surface, surface_max_time
+
+    origins = random_origins(args.origins, args.seed)
+    max_time = surface_max_time(max(times))
+
+    results = {"load": {}, "memory_mb": {}, "modes": {}}
+
+    rss = max_rss_mb()
+    start = time.perf_counter()
+    get_transport_network(args.region)
+    results["load"]["r5py"] = time.perf_counter() - start
+    runtime = jpype.JClass("java.lang.Runtime").getRuntime()
+    results["memory_mb"]["r5py_jvm_heap_used"] = (
+        runtime.totalMemory() - runtime.freeMemory()
+    ) / 2**20
+    results["memory_mb"]["r5py_max_rss_increase"] = max_rss_mb() - rss
+
+    for mode in modes:
+        rss = max_rss_mb()
+        start = time.perf_counter()
+        graph = get_street_graph(args.region, mode)
+        results["load"][f"graph_{mode}"] = time.perf_counter() - start
+        results["memory_mb"][f"graph_{mode}_arrays"] = graph.nbytes / 2**20
+        results["memory_mb"][f"graph_{mode}_max_rss_increase"] = max_rss_mb() - rss
+
+        latency = {"r5py": [], "graph": []}
+        overlap = {t: [] for t in times}
+        for lon, lat in origins:
+            start = time.perf_counter()
+            reference = route_travel_time_surface_r5py(args.region, lon, lat, mode, max_time)
+            latency["r5py"].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            surface = graph.travel_time_surface(lon, lat, max_time)
+            latency["graph"].append(time.perf_counter() - start)
+
+            for t in times:
+                overlap[t].append(
+                    iou(isochrone_from_surface(surface, t), isochrone_from_surface(reference, t))
+                )
+
+        results["modes"][mode] = {
+            "latency": {engine: summarize(v) for engine, v in latency.items()},
+            "iou": {str(t): summarize(v) for t, v in overlap.items()},
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{args.region}, {args.origins} origins, surfaces up to {max_time}s")
+    print("\nload (s):  " + "  ".join(f"{k}={v:.2f}" for k, v in results["load"].items()))
+    print("memory (MB):")
+    for name, value in results["memory_mb"].items():
+        print(f"  {name:<32}{value:>10.1f}")
+    for mode, result in results["modes"].items():
+        print(f"\n{mode}")
+        print(f"  {'latency':<16}{'median':>10}{'p95':>10}")
+        for engine, stats in result["latency"].items():
+            print(f"  {engine:<16}{stats['median'] * 1e3:>8.1f}ms{stats['p95'] * 1e3:>8.1f}ms")
+        print(f"  {'IoU vs r5py':<16}{'median':>10}{'min':>10}")
+        for t, stats in result["iou"].items():
+            print(f"  {t + 's':<16}{stats['median']:>10.3f}{stats['min']:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
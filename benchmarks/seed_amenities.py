@@ -0,0 +1,53 @@
+"""
+Load the amenities of the recorded response in http_requests/response.json
+into the database, so the benchmark stack does not depend on Overpass.
+"""
+import logging
+import os
+import sys
+import json
+from pathlib import Path
+
+from shapely.geometry import Point
+from sqlalchemy import create_engine
+
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from scripts.poi_download import transfer_amenities_to_database
+from functions.poi_snapshot import export_snapshot
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+POSTGRES_CONNECTION_STRING = os.getenv("DATABASE_URL")
+RESPONSE_FILE = root_dir / "http_requests" / "response.json"
+# The recorded response was made in Münster
+REGION = "muenster"
+
+
+def load_fixture_amenities() -> list[dict]:
+    with open(RESPONSE_FILE) as f:
+        elements = json.load(f)["amenities"]
+
+    return [
+        {
+            "id": element["id"],
+            "geometry": Point(element["lon"], element["lat"]),
+            "name": element["tags"].get("name"),
+            "amenity": element["tags"].get("amenity"),
+            "cuisine": element["tags"].get("cuisine"),
+        }
+        for element in elements
+    ]
+
+
+if __name__ == "__main__":
+    engine = create_engine(POSTGRES_CONNECTION_STRING)
+    amenities = load_fixture_amenities()
+    logger.info(f"Seeding {len(amenities)} amenities from {RESPONSE_FILE.name}")
+    transfer_amenities_to_database(amenities, engine, REGION)
+    export_snapshot(engine, REGION)
@@ -0,0 +1,290 @@
+import asyncio
+import logging
+import os
+import threading
+
+from sqlalchemy import Engine, text
+
+from .metrics import CACHE_REQUESTS
+
+logger = logging.getLogger(__name__)
+
+ISOCHRONE_TTL = "1 day"  # PostgreSQL interval
+ISOCHRONE_TTL_SECONDS = 24 * 60 * 60  # the same, for in-process caches
+# Upper bound for cached isochrones; least recently hit rows are evicted first
+ISOCHRONE_MAX_ROWS = int(os.getenv("ISOCHRONE_MAX_ROWS", "200000"))
+# Upper bound for stored travel-time surfaces (≈200 KB each); least recently
+# read rows are evicted first
+SURFACE_MAX_ROWS = int(os.getenv("SURFACE_MAX_ROWS", "10000"))
+# Rows deleted per statement, so maintenance never holds long locks
+CACHE_PURGE_BATCH_SIZE = int(os.getenv("CACHE_PURGE_BATCH_SIZE", "5000"))
+# Seconds between maintenance runs of the API process (0 disables them)
+CACHE_MAINTENANCE_INTERVAL_SECONDS = int(
+    os.getenv("CACHE_MAINTENANCE_INTERVAL_SECONDS", "900")
+)
+# Seconds between writes of the cache hits counted by an API process, also
+# with maintenance moved to scripts/cache_maintenance.py (0 disables hit tracking)
+CACHE_HIT_FLUSH_SECONDS = int(os.getenv("CACHE_HIT_FLUSH_SECONDS", "60"))
+
+
+# Cache hits not written yet: (region, id) -> count. Lookups stay read-only;
+# flush_isochrone_hits adds them to hit_count and last_hit_at in one statement.
+_pending_hits: dict[tuple[str, int], int] = {}
+# Stored surfaces read since the last flush: (region, id); only last_hit_at is kept
+_pending_surface_hits: set[tuple[str, int]] = set()
+_pending_hits_lock = threading.Lock()
+
+
+def record_isochrone_hit(region: str, isochrone_id: int):
+    if CACHE_HIT_FLUSH_SECONDS <= 0:
+        return  # never flushed
+    key = (region, isochrone_id)
+    with _pending_hits_lock:
+        _pending_hits[key] = _pending_hits.get(key, 0) + 1
+
+
+def record_surface_hit(region: str, surface_id: int):
+    if CACHE_HIT_FLUSH_SECONDS <= 0:
+        return  # never flushed
+    with _pending_hits_lock:
+        _pending_surface_hits.add((region, surface_id))
+
+
+def flush_isochrone_hits(engine: Engine) -> int:
+    """
+    Write the hits counted since the last flush. last_hit_at becomes the flush
+    time, which is precise enough for least-recently-used eviction.
+    Returns the number of updated rows.
+    """
+    with _pending_hits_lock:
+        hits = dict(_pending_hits)
+        _pending_hits.clear()
+    if not hits:
+        return 0
+
+    try:
+        with engine.begin() as conn:
+            result = conn.execute(
+                text(
+                    """
+                    UPDATE isochrones
+                    SET
+                        last_hit_at = now(),
+                        hit_count = isochrones.hit_count + hits.count
+                    FROM unnest(
+                        CAST(:regions AS text[]),
+                        CAST(:ids AS bigint[]),
+                        CAST(:counts AS bigint[])
+                    ) AS hits (region, id, count)
+                    WHERE isochrones.region = hits.region AND isochrones.id = hits.id
+                    """
+                ),
+                {
+                    "regions": [region for region, _ in hits],
+                    "ids": [isochrone_id for _, isochrone_id in hits],
+                    "counts": list(hits.values()),
+                },
+            )
+    except Exception:
+        # Keep them for the next run
+        with _pending_hits_lock:
+            for key, count in hits.items():
+                _pending_hits[key] = _pending_hits.get(key, 0) + count
+        raise
+    return result.rowcount
+
+
+def flush_surface_hits(engine: Engine) -> int:
+    """Set last_hit_at of the surfaces read since the last flush. Returns the updated rows."""
+    with _pending_hits_lock:
+        hits = list(_pending_surface_hits)
+        _pending_surface_hits.clear()
+    if not hits:
+        return 0
+
+    try:
+        with engine.begin() as conn:
+            result = conn.execute(
+                text(
+                    """
+                    UPDATE travel_time_surfaces
+                    SET last_hit_at = now()
+                    FROM unnest(
+                        CAST(:regions AS text[]),
+                        CAST(:ids AS bigint[])
+                    ) AS hits (region, id)
+                    WHERE
+                        travel_time_surfaces.region = hits.region
+                        AND travel_time_surfaces.id = hits.id
+                    """
+                ),
+                {
+                    "regions": [region for region, _ in hits],
+                    "ids": [surface_id for _, surface_id in hits],
+                },
+            )
+    except Exception:
+        # Keep them for the next run
+        with _pending_hits_lock:
+            _pending_surface_hits.update(hits)
+        raise
+    return result.rowcount
+
+
+def flush_cache_hits(engine: Engine) -> int:
+    """Write the isochrone and surface hits counted since the last flush."""
+    return flush_isochrone_hits(engine) + flush_surface_hits(engine)
+
+
+def purge_expired_isochrones(
+    engine: Engine,
+    batch_size: int = CACHE_PURGE_BATCH_SIZE,
+    table: str = "isochrones",
+) -> int:
+    """
+    Delete rows of a cache table older than ISOCHRONE_TTL in batches.
+    Returns the number of deleted rows.
+    """
+    sql = text(
+        f"""
+        DELETE FROM {table}
+        WHERE (region, id) IN (
+            SELECT region, id
+            FROM {table}
+            WHERE created_at < now() - INTERVAL :ttl
+            LIMIT :batch_size
+        )
+        """
+    )
+
+    deleted = 0
+    while True:
+        with engine.begin() as conn:
+            result = conn.execute(sql, {"ttl": ISOCHRONE_TTL, "batch_size": batch_size})
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+
+
+def enforce_isochrone_limit(
+    engine: Engine,
+    max_rows: int = ISOCHRONE_MAX_ROWS,
+    batch_size: int = CACHE_PURGE_BATCH_SIZE,
+    table: str = "isochrones",
+) -> int:
+    """
+    Evict the least recently used rows of a cache table (isochrones by
+    default) until at most max_rows are left.
+    Rows that were never hit count as used when they were created.
+    Returns the number of deleted rows.
+    """
+    with engine.connect() as conn:
+        count = conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+
+    excess = count - max_rows
+    deleted = 0
+    while excess > 0:
+        with engine.begin() as conn:
+            result = conn.execute(
+                text(
+                    f"""
+                    DELETE FROM {table}
+                    WHERE (region, id) IN (
+                        SELECT region, id
+                        FROM {table}
+                        ORDER BY COALESCE(last_hit_at, created_at)
+                        LIMIT :batch_size
+                    )
+                    """
+                ),
+                {"batch_size": min(batch_size, excess)},
+            )
+        if result.rowcount == 0:
+            break
+        deleted += result.rowcount
+        excess -= result.rowcount
+
+    return deleted
+
+
+def run_cache_maintenance(engine: Engine) -> dict[str, int]:
+    # Before eviction, so it sees the latest hits
+    hit_rows = flush_cache_hits(engine)
+    expired = purge_expired_isochrones(engine)
+    expired_surfaces = purge_expired_isochrones(engine, table="travel_time_surfaces")
+    evicted = enforce_isochrone_limit(engine)
+    evicted_surfaces = enforce_isochrone_limit(
+        engine, SURFACE_MAX_ROWS, table="travel_time_surfaces"
+    )
+    logger.info(
+        f"Cache maintenance: {expired} expired, {evicted} evicted isochrones, "
+        f"{expired_surfaces} expired, {evicted_surfaces} evicted travel-time surfaces"
+    )
+    return {
+        "hit_rows": hit_rows,
+        "expired": expired,
+        "evicted": evicted,
+        "expired_surfaces": expired_surfaces,
+        "evicted_surfaces": evicted_surfaces,
+    }
+
+
+def get_cache_stats(engine: Engine) -> dict:
+    """
+    Size of the isochrone cache and hit rates.
+    hit_count covers all processes over the rows' lifetime (up to their last
+    hit flush), hits/misses only this process since it started.
+    """
+    with engine.connect() as conn:
+        row = conn.execute(
+            text(
+                """
+                SELECT
+                    count(*) AS rows,
+                    COALESCE(sum(hit_count), 0) AS hit_count,
+                    count(*) FILTER (WHERE created_at < now() - INTERVAL :ttl) AS expired_rows,
+                    min(created_at) AS oldest,
+                    (
+                        SELECT COALESCE(sum(pg_total_relation_size(relid)), 0)
+                        FROM pg_partition_tree('isochrones')
+                    ) AS size_bytes
+                FROM isochrones
+                """
+            ),
+            {"ttl": ISOCHRONE_TTL},
+        ).one()
+
+    hits = CACHE_REQUESTS.value(cache="isochrone", result="hit")
+    misses = CACHE_REQUESTS.value(cache="isochrone", result="miss")
+
+    return {
+        "rows": row.rows,
+        "max_rows": ISOCHRONE_MAX_ROWS,
+        "expired_rows": row.expired_rows,
+        "size_bytes": row.size_bytes,
+        "oldest": row.oldest.isoformat() if row.oldest else None,
+        "hit_count": row.hit_count,
+        "hits": int(hits),
+        "misses": int(misses),
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+    }
+
+
+async def hit_flush_loop(engine: Engine, interval: int = CACHE_HIT_FLUSH_SECONDS):
+    """Write the counted cache hits every `interval` seconds, off the event loop."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(flush_cache_hits, engine)
+        except Exception:
+            logger.exception("Could not write cache hits")
+
+
+async def maintenance_loop(engine: Engine, interval: int = CACHE_MAINTENANCE_INTERVAL_SECONDS):
+    """Run cache maintenance every `interval` seconds, off the event loop."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await asyncio.to_thread(run_cache_maintenance, engine)
+        except Exception:
+            logger.exception("Cache maintenance failed")
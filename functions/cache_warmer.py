@@ -0,0 +1,311 @@
+import asyncio
+import logging
+import os
+import time as time_module
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Callable, Optional
+
+from sqlalchemy import Engine, text
+
+from .metrics import CACHE_WARMED
+from .reachability import (
+    MODES,
+    Isochrone,
+    Mode,
+    route_surface_once,
+    save_isochrone,
+    snap_origin,
+)
+from .regions import load_regions
+from .surfaces import isochrone_from_surface, load_surface_from_db, surface_max_time
+
+logger = logging.getLogger(__name__)
+
+# Off-peak hours (server local time) in which the API warms the cache, e.g.
+# "2-6" or "22-5" (unset: no scheduled warming; scripts/cache_warm.py still works)
+CACHE_WARM_HOURS = os.getenv("CACHE_WARM_HOURS", "")
+# Origins warmed per region and pass, most requested first
+CACHE_WARM_ORIGINS = int(os.getenv("CACHE_WARM_ORIGINS", "200"))
+# Isochrone times (seconds) warmed for every origin and mode
+CACHE_WARM_TIMES = [
+    int(t) for t in os.getenv("CACHE_WARM_TIMES", "300,600,900,1200").split(",") if t.strip()
+]
+# Average CPU seconds per second the warmer may use (0.5: half a core). Measured
+# for the whole process: r5py's JVM runs in it, and requests served meanwhile
+# count as well, which makes the warmer back off under load
+CACHE_WARM_CPU_BUDGET = float(os.getenv("CACHE_WARM_CPU_BUDGET", "0.5"))
+# Entries younger than this (PostgreSQL interval) are not warmed again; older
+# ones would expire before the next off-peak window
+CACHE_WARM_REFRESH_AGE = os.getenv("CACHE_WARM_REFRESH_AGE", "12 hours")
+# Origins between checks of the off-peak window
+CACHE_WARM_BATCH_SIZE = 10
+# Grid cell (degrees, ≈500 m) of the POI-density seeds
+DENSITY_SEED_CELL_DEGREES = 0.005
+# Seconds between checks whether the off-peak window has started
+CACHE_WARM_CHECK_SECONDS = 60
+# Advisory lock, so only one API worker warms at a time
+CACHE_WARM_LOCK_ID = 1501
+
+
+@dataclass(frozen=True)
+class Seed:
+    region: str
+    longitude: float
+    latitude: float
+    weight: int  # cache hits, or amenities around a density seed
+    source: str  # "history" or "density"
+
+
+def parse_hours(hours: str) -> Optional[tuple[int, int]]:
+    """'2-6' -> (2, 6); None if unset. ValueError if malformed."""
+    if not hours.strip():
+        return None
+    try:
+        start, end = (int(h) for h in hours.split("-"))
+    except ValueError:
+        raise ValueError(f"CACHE_WARM_HOURS must look like '2-6', got {hours!r}") from None
+    if not (0 <= start <= 23 and 0 <= end <= 23):
+        raise ValueError(f"CACHE_WARM_HOURS must be hours from 0 to 23, got {hours!r}")
+    return start, end
+
+
+def in_window(window: Optional[tuple[int, int]], now: Optional[datetime] = None) -> bool:
+    if window is None:
+        return False
+    hour = (now or datetime.now()).hour
+    start, end = window
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end
+
+
+def history_seeds(engine: Engine, region: str, limit: int) -> list[Seed]:
+    """Snapped origins with the most cache hits over all modes and times."""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                """
+                SELECT
+                    ST_X(origin) AS lon,
+                    ST_Y(origin) AS lat,
+                    sum(hit_count) AS hits
+                FROM isochrones
+                WHERE region = :region
+                GROUP BY origin
+                HAVING sum(hit_count) > 0
+                ORDER BY hits DESC
+                LIMIT :limit
+                """
+            ),
+            {"region": region, "limit": limit},
+        ).fetchall()
+    return [Seed(region, row.lon, row.lat, int(row.hits), "history") for row in rows]
+
+
+def density_seeds(engine: Engine, region: str, limit: int) -> list[Seed]:
+    """Centres of the grid cells with the most amenities."""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                """
+                SELECT
+                    ST_X(center) AS lon,
+                    ST_Y(center) AS lat,
+                    amenities
+                FROM (
+                    SELECT
+                        ST_Centroid(ST_Collect(geometry)) AS center,
+                        count(*) AS amenities
+                    FROM amenities
+                    WHERE region = :region
+                    GROUP BY ST_SnapToGrid(geometry, :cell)
+                ) AS cells
+                ORDER BY amenities DESC
+                LIMIT :limit
+                """
+            ),
+            {"region": region, "cell": DENSITY_SEED_CELL_DEGREES, "limit": limit},
+        ).fetchall()
+    return [Seed(region, row.lon, row.lat, int(row.amenities), "density") for row in rows]
+
+
+def select_seeds(engine: Engine, region: str, limit: int = CACHE_WARM_ORIGINS) -> list[Seed]:
+    """
+    The most requested origins of a region. While the request history is
+    shorter than `limit` (new deployment, emptied cache), the remaining slots
+    are filled with the densest amenity clusters.
+    """
+    seeds = history_seeds(engine, region, limit)
+    if len(seeds) < limit:
+        known = {snap_origin(s.longitude, s.latitude) for s in seeds}
+        for seed in density_seeds(engine, region, limit):
+            if len(seeds) >= limit:
+                break
+            if snap_origin(seed.longitude, seed.latitude) not in known:
+                known.add(snap_origin(seed.longitude, seed.latitude))
+                seeds.append(seed)
+    return seeds
+
+
+def fresh_times(
+    engine: Engine,
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    times: list[int],
+) -> set[int]:
+    """The times whose cached isochrone is younger than CACHE_WARM_REFRESH_AGE."""
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                """
+                SELECT time_seconds
+                FROM isochrones
+                WHERE
+                    region = :region
+                    AND mode = :mode
+                    AND time_seconds = ANY (:times)
+                    AND ST_Equals(
+                        origin,
+                        ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)
+                    )
+                    AND created_at >= now() - INTERVAL :max_age
+                """
+            ),
+            {
+                "region": region,
+                "mode": mode,
+                "times": times,
+                "lon": longitude,
+                "lat": latitude,
+                "max_age": CACHE_WARM_REFRESH_AGE,
+            },
+        ).fetchall()
+    return {row.time_seconds for row in rows}
+
+
+def warm_origin(
+    engine: Engine,
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    times: list[int],
+) -> int:
+    """
+    Refresh the cached isochrones of one origin and mode that would expire
+    soon. All times are derived from one travel-time surface, which is only
+    routed again if the stored one is due as well.
+    Returns the number of refreshed isochrones.
+    """
+    longitude, latitude = snap_origin(longitude, latitude)
+    stale = sorted(set(times) - fresh_times(engine, region, longitude, latitude, mode, times))
+    if not stale:
+        return 0
+
+    max_time = surface_max_time(max(times))
+    surface = load_surface_from_db(
+        engine, region, mode, longitude, latitude, max_time, max_age=CACHE_WARM_REFRESH_AGE
+    )
+    if surface is None:
+        surface = route_surface_once(engine, region, longitude, latitude, mode, max_time)
+
+    for time in stale:
+        isochrone = Isochrone.from_geojson(isochrone_from_surface(surface, time))
+        save_isochrone(engine, region, longitude, latitude, mode, time, isochrone)
+    return len(stale)
+
+
+def warm_cache(
+    engine: Engine,
+    regions: Optional[list[str]] = None,
+    modes: list[Mode] = MODES,
+    times: list[int] = CACHE_WARM_TIMES,
+    limit: int = CACHE_WARM_ORIGINS,
+    cpu_budget: float = CACHE_WARM_CPU_BUDGET,
+    should_stop: Callable[[], bool] = lambda: False,
+) -> dict[str, int]:
+    """
+    Precompute the isochrones of the most requested origins for all modes and
+    times. After each origin the warmer sleeps long enough to keep the average
+    CPU use of the process (JVM and concurrent requests included) at
+    cpu_budget, so requests served meanwhile keep their share.
+    should_stop is checked between batches of CACHE_WARM_BATCH_SIZE origins.
+    """
+    stats = {"origins": 0, "isochrones": 0, "failed": 0}
+    if not times:
+        return stats
+
+    for region in regions or list(load_regions()):
+        seeds = select_seeds(engine, region, limit)
+        logger.info(f"Warming {len(seeds)} origins of '{region}'")
+
+        for index, seed in enumerate(seeds):
+            if index % CACHE_WARM_BATCH_SIZE == 0 and should_stop():
+                logger.info(f"Cache warming stopped: {stats}")
+                return stats
+
+            start_wall = time_module.perf_counter()
+            start_cpu = time_module.process_time()
+            for mode in modes:
+                try:
+                    warmed = warm_origin(
+                        engine, region, seed.longitude, seed.latitude, mode, times
+                    )
+                except Exception:
+                    logger.exception(
+                        f"Could not warm {mode} isochrones at "
+                        f"({seed.longitude}, {seed.latitude})"
+                    )
+                    stats["failed"] += 1
+                    CACHE_WARMED.inc(result="failed")
+                    continue
+                stats["isochrones"] += warmed
+                CACHE_WARMED.inc(warmed, result="warmed")
+            stats["origins"] += 1
+
+            if cpu_budget > 0:
+                cpu = time_module.process_time() - start_cpu
+                wall = time_module.perf_counter() - start_wall
+                time_module.sleep(max(0.0, cpu / cpu_budget - wall))
+
+    logger.info(f"Cache warming done: {stats}")
+    return stats
+
+
+def warm_cache_exclusively(engine: Engine, **kwargs) -> Optional[dict[str, int]]:
+    """warm_cache unless another process holds the warming lock (then None)."""
+    with engine.connect() as conn:
+        locked = conn.execute(
+            text("SELECT pg_try_advisory_lock(:id)"), {"id": CACHE_WARM_LOCK_ID}
+        ).scalar()
+        # The session lock outlives the transaction; don't stay idle in it
+        conn.commit()
+        if not locked:
+            return None
+        try:
+            return warm_cache(engine, **kwargs)
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": CACHE_WARM_LOCK_ID})
+            conn.commit()
+
+
+async def warming_loop(engine: Engine, window: tuple[int, int]):
+    """Warm the cache once per off-peak window (see parse_hours), off the event loop."""
+    warmed = False
+    while True:
+        await asyncio.sleep(CACHE_WARM_CHECK_SECONDS)
+        if not in_window(window):
+            warmed = False
+            continue
+        if warmed:
+            continue
+        warmed = True
+        try:
+            await asyncio.to_thread(
+                warm_cache_exclusively, engine, should_stop=lambda: not in_window(window)
+            )
+        except Exception:
+            logger.exception("Cache warming failed")
@@ -0,0 +1,93 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from sqlalchemy import Connection, text
+from sqlalchemy.exc import DBAPIError
+
+from .metrics import DEGRADED_RESPONSES
+
+# Time budget of a request in seconds (0: no deadline). Clients can ask for a
+# shorter or longer one with DEADLINE_HEADER, up to REQUEST_TIMEOUT_MAX_SECONDS.
+REQUEST_TIMEOUT_SECONDS = float(os.getenv("REQUEST_TIMEOUT_SECONDS", "30"))
+REQUEST_TIMEOUT_MAX_SECONDS = float(os.getenv("REQUEST_TIMEOUT_MAX_SECONDS", "120"))
+DEADLINE_HEADER = "x-request-timeout"
+# Kept free for the stages after the isochrone (amenities, scoring, serialization)
+DEADLINE_RESERVE_SECONDS = float(os.getenv("DEADLINE_RESERVE_SECONDS", "1"))
+# Queries always get at least this long, so cheap fallback lookups still run
+MIN_STATEMENT_TIMEOUT_SECONDS = 0.1
+
+# Deadline of the request currently being handled (time.monotonic()), and the
+# stages that were answered with a fallback. Set by the middleware in app.py.
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+_degraded: ContextVar[Optional[list[str]]] = ContextVar("degraded", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+def request_budget(header_value: Optional[str]) -> Optional[float]:
+    """The request's budget in seconds from the header or the config, None for none."""
+    budget = REQUEST_TIMEOUT_SECONDS
+    if header_value:
+        try:
+            budget = min(float(header_value), REQUEST_TIMEOUT_MAX_SECONDS)
+        except ValueError:
+            pass
+    return budget if budget > 0 else None
+
+
+def start_deadline(budget: Optional[float]) -> list[str]:
+    """
+    Start the deadline of the current request.
+    Returns the list the degraded stages will be added to.
+    """
+    _deadline.set(time.monotonic() + budget if budget is not None else None)
+    degraded: list[str] = []
+    _degraded.set(degraded)
+    return degraded
+
+
+def remaining(reserve: float = 0.0) -> Optional[float]:
+    """Seconds left until the deadline minus `reserve`, None without a deadline."""
+    deadline = _deadline.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic() - reserve
+
+
+def check_deadline(stage: str):
+    """Raise DeadlineExceeded before starting `stage` if no time is left."""
+    left = remaining()
+    if left is not None and left <= 0:
+        raise DeadlineExceeded(f"Deadline exceeded before {stage}")
+
+
+def mark_degraded(stage: str):
+    DEGRADED_RESPONSES.inc(stage=stage)
+    degraded = _degraded.get()
+    if degraded is not None and stage not in degraded:
+        degraded.append(stage)
+
+
+def degraded_stages() -> list[str]:
+    return list(_degraded.get() or [])
+
+
+def apply_statement_timeout(conn: Connection):
+    """Limit the queries of the current transaction to the time left."""
+    left = remaining()
+    if left is None:
+        return
+    timeout_ms = int(max(left, MIN_STATEMENT_TIMEOUT_SECONDS) * 1000)
+    conn.execute(
+        text("SELECT set_config('statement_timeout', :timeout, true)"),
+        {"timeout": str(timeout_ms)},
+    )
+
+
+def is_statement_timeout(error: DBAPIError) -> bool:
+    # 57014: query_canceled
+    return getattr(error.orig, "pgcode", None) == "57014"
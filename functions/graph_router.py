@@ -0,0 +1,256 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+import pyproj
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+from scipy.spatial import cKDTree
+
+from .network_cache import (
+    MAX_RESIDENT_NETWORKS,
+    NETWORK_CACHE_DIR,
+    NETWORK_IDLE_SECONDS,
+    file_hash,
+)
+from .regions import get_region, utm_crs_for
+from .surfaces import build_destination_grid, make_surface
+
+logger = logging.getLogger(__name__)
+
+# Modes routed in-process on a street graph instead of by r5py, e.g. "walk,bike"
+GRAPH_ROUTER_MODES = {
+    mode.strip() for mode in os.getenv("GRAPH_ROUTER_MODES", "").split(",") if mode.strip()
+}
+
+# pyrosm network per mode; only walk and bike do without per-road speeds
+MODE_NETWORK_TYPE = {"walk": "walking", "bike": "cycling"}
+# r5py's default speeds, so both engines give comparable isochrones
+MODE_SPEED_MPS = {"walk": 3.6 / 3.6, "bike": 12.0 / 3.6}
+# Destinations farther than this from the network are unreachable (as in R5)
+SNAP_RADIUS_METERS = 300.0
+
+GRAPH_CACHE_SUFFIX = ".graph.npz"
+
+
+@dataclass
+class StreetGraph:
+    """A street network as a CSR matrix of travel times between nodes (seconds)."""
+
+    mode: str
+    matrix: csr_matrix
+    lon: np.ndarray
+    lat: np.ndarray
+    tree: cKDTree  # over the nodes' UTM coordinates
+    transformer: pyproj.Transformer  # EPSG:4326 -> UTM
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.matrix.data, self.matrix.indices, self.matrix.indptr, self.lon, self.lat]
+        return sum(a.nbytes for a in arrays) + self.tree.data.nbytes
+
+    @classmethod
+    def from_arrays(
+        cls,
+        mode: str,
+        lon: np.ndarray,
+        lat: np.ndarray,
+        source: np.ndarray,
+        target: np.ndarray,
+        seconds: np.ndarray,
+    ) -> "StreetGraph":
+        # Keep the fastest of parallel edges; csr_matrix would sum them
+        order = np.lexsort((seconds, target, source))
+        source, target, seconds = source[order], target[order], seconds[order]
+        first = np.ones(len(source), dtype=bool)
+        first[1:] = (source[1:] != source[:-1]) | (target[1:] != target[:-1])
+        matrix = csr_matrix(
+            (seconds[first], (source[first], target[first])), shape=(len(lon), len(lon))
+        )
+
+        crs = utm_crs_for(float(np.mean(lon)), float(np.mean(lat)))
+        transformer = pyproj.Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+        x, y = transformer.transform(lon, lat)
+        return cls(mode, matrix, lon, lat, cKDTree(np.column_stack((x, y))), transformer)
+
+    @classmethod
+    def from_pbf(cls, pbf_file: Path, mode: str) -> "StreetGraph":
+        import pyrosm
+
+        osm = pyrosm.OSM(str(pbf_file))
+        nodes, edges = osm.get_network(
+            network_type=MODE_NETWORK_TYPE[mode],
+            nodes=True,
+            extra_attributes=["oneway:bicycle"],
+        )
+
+        node_ids = nodes["id"].to_numpy(dtype=np.int64)
+        order = np.argsort(node_ids)
+        node_ids = node_ids[order]
+        lon = nodes["lon"].to_numpy(dtype=np.float64)[order]
+        lat = nodes["lat"].to_numpy(dtype=np.float64)[order]
+
+        u = np.searchsorted(node_ids, edges["u"].to_numpy(dtype=np.int64))
+        v = np.searchsorted(node_ids, edges["v"].to_numpy(dtype=np.int64))
+        seconds = edges["length"].to_numpy(dtype=np.float64) / MODE_SPEED_MPS[mode]
+
+        # Walking ignores one-way streets; cycling honours them unless
+        # oneway:bicycle=no allows riding against the direction
+        forward = np.ones(len(edges), dtype=bool)
+        backward = np.ones(len(edges), dtype=bool)
+        if mode == "bike":
+            oneway = edges["oneway"].fillna("no").to_numpy()
+            if "oneway:bicycle" in edges:
+                contraflow = edges["oneway:bicycle"].fillna("").to_numpy() == "no"
+            else:
+                contraflow = np.zeros(len(edges), dtype=bool)
+            backward = ~np.isin(oneway, ["yes", "true", "1"]) | contraflow
+            forward = (oneway != "-1") | contraflow
+
+        return cls.from_arrays(
+            mode,
+            lon,
+            lat,
+            np.concatenate((u[forward], v[backward])),
+            np.concatenate((v[forward], u[backward])),
+            np.concatenate((seconds[forward], seconds[backward])),
+        )
+
+    def save(self, path: Path):
+        matrix = self.matrix.tocoo()
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp.npz")
+        np.savez(
+            tmp_path,
+            lon=self.lon,
+            lat=self.lat,
+            source=matrix.row,
+            target=matrix.col,
+            seconds=matrix.data,
+        )
+        os.replace(tmp_path, path)
+
+        # Graphs of older extracts are never read again
+        for old in path.parent.glob(f"*-{self.mode}{GRAPH_CACHE_SUFFIX}"):
+            if old != path:
+                old.unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, path: Path, mode: str) -> "StreetGraph":
+        with np.load(path) as data:
+            return cls.from_arrays(
+                mode,
+                data["lon"],
+                data["lat"],
+                data["source"],
+                data["target"],
+                data["seconds"],
+            )
+
+    def travel_time_surface(
+        self, longitude: float, latitude: float, max_time_seconds: int
+    ) -> np.ndarray:
+        """
+        Travel times from the origin to the same destination grid r5py is asked
+        for: shortest paths to all nodes within max_time_seconds, then each
+        destination takes the time of its nearest node plus the way to it.
+        """
+        speed = MODE_SPEED_MPS[self.mode]
+        origin_xy = self.transformer.transform(longitude, latitude)
+        snap_distance, source = self.tree.query(origin_xy)
+        if snap_distance > SNAP_RADIUS_METERS:
+            return make_surface([], [], [])
+
+        access = snap_distance / speed
+        node_times = dijkstra(
+            self.matrix, indices=source, limit=max(0.0, max_time_seconds - access)
+        ) + access
+
+        lon, lat = build_destination_grid(longitude, latitude, self.mode, max_time_seconds)
+        x, y = self.transformer.transform(lon, lat)
+        distance, nearest = self.tree.query(
+            np.column_stack((x, y)), distance_upper_bound=SNAP_RADIUS_METERS
+        )
+        linked = np.isfinite(distance)
+        times = np.full(len(lon), np.inf)
+        times[linked] = node_times[nearest[linked]] + distance[linked] / speed
+
+        reached = times <= max_time_seconds
+        return make_surface(lon[reached], lat[reached], times[reached])
+
+
+def graph_cache_path(region: str, pbf_file: Path, mode: str) -> Path:
+    return NETWORK_CACHE_DIR / region / f"{file_hash(pbf_file)}-{mode}{GRAPH_CACHE_SUFFIX}"
+
+
+# (region, mode) -> (graph, last used); ordered from least to most recently used
+_graphs: "OrderedDict[tuple[str, str], tuple[StreetGraph, float]]" = OrderedDict()
+_graphs_lock = threading.Lock()
+# One lock per graph, so it is only built once at a time without blocking
+# requests for other regions and modes.
+_graph_locks: dict[tuple[str, str], threading.Lock] = {}
+
+
+def load_street_graph(region: str, mode: str) -> StreetGraph:
+    """Load a street graph from the cache, or build it from the PBF and cache it."""
+    pbf_file = get_region(region).find_pbf()
+    if pbf_file is None:
+        raise FileNotFoundError(f"No .osm.pbf file found for region '{region}'")
+
+    path = graph_cache_path(region, pbf_file, mode)
+    if path.exists():
+        return StreetGraph.load(path, mode)
+
+    logger.info(f"Building {mode} street graph from {pbf_file}")
+    graph = StreetGraph.from_pbf(pbf_file, mode)
+    try:
+        graph.save(path)
+    except OSError:
+        logger.exception(f"Could not write street graph cache {path}")
+    return graph
+
+
+def evict_idle_graphs():
+    """Drop street graphs that were not used for NETWORK_IDLE_SECONDS."""
+    now = time.monotonic()
+    with _graphs_lock:
+        for key, (_, last_used) in list(_graphs.items()):
+            if now - last_used > NETWORK_IDLE_SECONDS:
+                logger.info(f"Evicting idle street graph {key}")
+                del _graphs[key]
+
+
+def get_street_graph(region: str, mode: str) -> StreetGraph:
+    """
+    Get the street graph of a region and mode, loading it on first use.
+    Kept in memory like transport networks: MAX_RESIDENT_NETWORKS at most,
+    evicted when idle for NETWORK_IDLE_SECONDS.
+    """
+    key = (region, mode)
+    with _graph_locks.setdefault(key, threading.Lock()):
+        with _graphs_lock:
+            entry = _graphs.pop(key, None)
+            if entry is not None:
+                graph = entry[0]
+                _graphs[key] = (graph, time.monotonic())
+
+        if entry is None:
+            graph = load_street_graph(region, mode)
+
+            with _graphs_lock:
+                _graphs[key] = (graph, time.monotonic())
+                while len(_graphs) > MAX_RESIDENT_NETWORKS:
+                    evicted, _ = _graphs.popitem(last=False)
+                    logger.info(f"Evicting least recently used street graph {evicted}")
+
+    evict_idle_graphs()
+    return graph
+
+
+def uses_graph_router(mode: str) -> bool:
+    return mode in GRAPH_ROUTER_MODES and mode in MODE_NETWORK_TYPE
@@ -0,0 +1,187 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+# Latency buckets in seconds, shared by all histograms.
+# Covers everything from a cache hit (~ms) up to a cold r5py run (~minute).
+DEFAULT_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0,
+)
+
+# Stage timings of the request currently being handled: [(stage, seconds), ...]
+# Set by the middleware in app.py, read back to build the Server-Timing header.
+_request_timings: ContextVar[Optional[list[tuple[str, float]]]] = ContextVar(
+    "request_timings", default=None
+)
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    inner = ",".join(
+        '{}="{}"'.format(key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels
+    )
+    return "{" + inner + "}"
+
+
+class Counter:
+    """Monotonic counter with labels, rendered in Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: dict[tuple[tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} counter",
+        ]
+        with self._lock:
+            items = list(self._values.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{_format_labels(labels)} {value}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram with labels, rendered in Prometheus text format."""
+
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._values: dict[tuple[tuple[str, str], ...], list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = [0.0] * (len(self.buckets) + 2)
+                self._values[key] = data
+            data[index] += 1
+            data[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} histogram",
+        ]
+        with self._lock:
+            items = [(labels, list(data)) for labels, data in self._values.items()]
+        for labels, data in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, data):
+                cumulative += count
+                bucket_labels = labels + (("le", repr(bound)),)
+                lines.append(
+                    f"{self.name}_bucket{_format_labels(bucket_labels)} {cumulative}"
+                )
+            cumulative += data[len(self.buckets)]
+            lines.append(
+                f'{self.name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {cumulative}'
+            )
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {data[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {cumulative}")
+        return lines
+
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Latency of HTTP requests by route, method and status code.",
+)
+STAGE_LATENCY = Histogram(
+    "stage_duration_seconds",
+    "Latency of the individual processing stages of a request.",
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache name and result (hit or miss).",
+)
+
+DEGRADED_RESPONSES = Counter(
+    "degraded_responses_total",
+    "Stages answered with a fallback because the request deadline ran out.",
+)
+
+CACHE_WARMED = Counter(
+    "cache_warmed_isochrones_total",
+    "Isochrones precomputed by the cache warmer, by result (warmed or failed).",
+)
+
+REGISTRY: list = [
+    REQUEST_LATENCY,
+    STAGE_LATENCY,
+    CACHE_REQUESTS,
+    DEGRADED_RESPONSES,
+    CACHE_WARMED,
+]
+
+
+@contextmanager
+def timer(stage: str) -> Iterator[None]:
+    """
+    Time a processing stage.
+    The duration is recorded in the stage histogram and, when called inside a
+    request, added to that request's Server-Timing header.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_LATENCY.observe(elapsed, stage=stage)
+        timings = _request_timings.get()
+        if timings is not None:
+            timings.append((stage, elapsed))
+
+
+def record_cache_result(cache: str, hit: bool) -> None:
+    CACHE_REQUESTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def start_request() -> list[tuple[str, float]]:
+    """Start collecting stage timings for the current request."""
+    timings: list[tuple[str, float]] = []
+    _request_timings.set(timings)
+    return timings
+
+
+def server_timing_header(timings: list[tuple[str, float]], total: float) -> str:
+    """
+    Build a Server-Timing header value (durations in milliseconds).
+    Repeated stages (e.g. several DB queries) are summed.
+    """
+    merged: dict[str, float] = {}
+    for stage, seconds in timings:
+        merged[stage] = merged.get(stage, 0.0) + seconds
+
+    entries = [f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in merged.items()]
+    entries.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(entries)
+
+
+def render_metrics() -> str:
+    """Render all registered metrics in the Prometheus text exposition format."""
+    lines: list[str] = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
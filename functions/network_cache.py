@@ -0,0 +1,163 @@
+import hashlib
+import logging
+import os
+import time
+from pathlib import Path
+
+import jpype
+import r5py
+from filelock import FileLock
+from r5py import TransportNetwork
+from r5py.util import Config, FileDigest
+
+from .regions import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Built transport networks, serialized so later processes skip parsing the PBF.
+# Layout: <NETWORK_CACHE_DIR>/<region>/<pbf hash>-r5py-<version>.transport_network
+NETWORK_CACHE_DIR = Path(
+    os.getenv("NETWORK_CACHE_DIR", str(DATA_DIR / "network_cache"))
+)
+NETWORK_CACHE_SUFFIX = ".transport_network"
+# Networks (and street graphs) kept in memory at once; the least recently used
+# one is evicted first. Those unused for NETWORK_IDLE_SECONDS are evicted as well.
+MAX_RESIDENT_NETWORKS = int(os.getenv("MAX_RESIDENT_NETWORKS", "2"))
+NETWORK_IDLE_SECONDS = int(os.getenv("NETWORK_IDLE_SECONDS", "3600"))
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        while chunk := f.read(HASH_BUFFER_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def network_cache_path(region: str, pbf_file: Path) -> Path:
+    """
+    Cache file of a region's network. A changed extract or r5py version
+    (whose serialization format may differ) gives a different file.
+    """
+    key = f"{file_hash(pbf_file)}-r5py-{r5py.__version__}"
+    return NETWORK_CACHE_DIR / region / f"{key}{NETWORK_CACHE_SUFFIX}"
+
+
+def _serializer():
+    # The JVM is running once r5py is imported
+    return jpype.JClass("com.conveyal.r5.kryo.KryoNetworkSerializer")
+
+
+class UnsupportedNetworkLayout(Exception):
+    """The installed r5py keeps more in a TransportNetwork than read_network restores."""
+
+
+def check_network_layout(network: TransportNetwork):
+    """
+    read_network restores nothing but the R5 network (_transport_network, as
+    in r5py 1.0.7). Checked before every write, so only layouts it can
+    restore are cached; the r5py version in the file name covers the read.
+    """
+    attributes = set(vars(network))
+    if attributes != {"_transport_network"}:
+        raise UnsupportedNetworkLayout(
+            f"r5py {r5py.__version__} TransportNetwork holds {sorted(attributes)}, "
+            "not only _transport_network; update read_network before caching it"
+        )
+
+
+def read_network(path: Path) -> TransportNetwork:
+    # TransportNetwork.__init__ would parse the PBF, so wrap the stored
+    # R5 network directly, as r5py does for its own cache.
+    network = TransportNetwork.__new__(TransportNetwork)
+    network._transport_network = _serializer().read(jpype.JClass("java.io.File")(str(path)))
+    return network
+
+
+def write_network(network: TransportNetwork, path: Path):
+    check_network_layout(network)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + ".tmp")
+    _serializer().write(
+        network._transport_network, jpype.JClass("java.io.File")(str(tmp_path))
+    )
+    # Atomic, so other workers never read a partially written network
+    os.replace(tmp_path, path)
+
+    # Networks of older extracts or r5py versions are never read again
+    for old in path.parent.glob(f"*{NETWORK_CACHE_SUFFIX}"):
+        if old != path:
+            old.unlink(missing_ok=True)
+
+
+def r5py_cache_files(pbf_file: Path) -> list[Path]:
+    """
+    The network and OSM database r5py keeps in its own cache directory for a
+    PBF, named by the same digest as in TransportNetwork.__init__ (without
+    GTFS or elevation model).
+    """
+    digest = hashlib.sha256(FileDigest(pbf_file).encode("utf-8")).hexdigest()
+    cache_dir = Path(Config().CACHE_DIR)
+    return [cache_dir / f"{digest}.transport_network", *cache_dir.glob(f"{digest}.mapdb*")]
+
+
+def clear_r5py_network_cache(pbf_file: Path):
+    """
+    Delete r5py's own copy of the network built from pbf_file. Networks live in
+    NETWORK_CACHE_DIR; a second copy there only costs disk space (and image
+    size), and would make a rebuild load instead of build. Files of other
+    extracts are left alone, as other processes may be building them.
+    """
+    for path in r5py_cache_files(pbf_file):
+        path.unlink(missing_ok=True)
+
+
+def build_network(pbf_file: Path) -> TransportNetwork:
+    """
+    Build a network from the PBF, without leaving a copy in r5py's cache.
+    Callers hold the extract's build lock (see load_cached_network).
+    """
+    clear_r5py_network_cache(pbf_file)
+    try:
+        return TransportNetwork(pbf_file)
+    finally:
+        clear_r5py_network_cache(pbf_file)
+
+
+def load_cached_network(region: str, pbf_file: Path) -> TransportNetwork:
+    """
+    Load a region's network from the cache, or build it from the PBF and
+    cache it for the next process.
+    """
+    path = network_cache_path(region, pbf_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    # One process builds an extract at a time (workers, prebuild script,
+    # warmer), so none deletes r5py's files under another's build, and the
+    # others read the network it cached instead of building it again.
+    with FileLock(f"{path}.lock"):
+        start = time.perf_counter()
+        if path.exists():
+            try:
+                network = read_network(path)
+            except jpype.JException:
+                logger.exception(f"Could not read cached network {path}, rebuilding")
+            else:
+                logger.info(
+                    f"Loaded cached network {path.name} "
+                    f"in {time.perf_counter() - start:.1f}s"
+                )
+                return network
+
+        network = build_network(pbf_file)
+        logger.info(f"Built network from {pbf_file} in {time.perf_counter() - start:.1f}s")
+
+        try:
+            write_network(network, path)
+        except UnsupportedNetworkLayout as e:
+            logger.error(f"Not caching the network of '{region}': {e}")
+        except (OSError, jpype.JException):
+            logger.exception(f"Could not write network cache {path}")
+
+    return network
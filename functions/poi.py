@@ -7,7 +7,20 @@ from sqlalchemy import text, Engine
 from typing import List, Union, Dict, Any
 from shapely.geometry import Polygon, Point
 from sqlalchemy import text, Engine
-from typing import List, Union, Dict, Any
+from typing import List, Union, Dict, Any, Optional, Iterator
+
+from sqlalchemy.exc import DBAPIError
+
+from .deadline import (
+    DeadlineExceeded,
+    apply_statement_timeout,
+    is_statement_timeout,
+    mark_degraded,
+    remaining,
+)
+from .metrics import timer
+from .serialization import COORDINATE_PRECISION
+from .poi_snapshot import get_snapshot
 
 # Define a polygon around a park (example coordinates)
 PARK_POLYGON_COORDS = "51.968 7.625 51.970 7.635 51.965 7.638 51.963 7.628 51.968 7.625"
@@ -113,6 +126,9 @@ AMENITY_CATEGORIES = {
 
 OVERPASS_URL = "https://overpass-api.de/api/interpreter"
 
+# Rows fetched per round trip when streaming POIs from a server-side cursor
+POI_STREAM_BATCH_SIZE = 2000
+
 
 def build_default_amenity_state() -> Dict[str, Any]:
     """
@@ -146,8 +162,43 @@ def extract_enabled_amenities(state: dict) -> list[str]:
     return enabled
 
 
+def group_amenities_by_category(
+    amenities: list[dict], state: dict
+) -> dict[str, list[dict]]:
+    """
+    Group POIs by the category of their amenity type, categories ordered by rank.
+    The order of POIs within a category is kept.
+    """
+    category_of = {
+        amenity: category
+        for category, cfg in state.items()
+        for amenity in cfg.get("amenities", {})
+    }
+    groups: dict[str, list[dict]] = {
+        category: []
+        for category, _ in sorted(state.items(), key=lambda item: item[1].get("rank", 0))
+    }
+    for amenity in amenities:
+        category = category_of.get(amenity["amenity"])
+        if category is not None:
+            groups[category].append(amenity)
+
+    return {category: pois for category, pois in groups.items() if pois}
+
+
+def _check_overpass_budget(delay: float = 0.0):
+    """Raise DeadlineExceeded if the request deadline leaves no time to retry."""
+    left = remaining()
+    if left is not None and left <= delay:
+        raise DeadlineExceeded("Request deadline exceeded during Overpass retries")
+
+
 async def fetch_overpass_data(query: str) -> List[OverpassElement]:
-    """Send Overpass QL to the Overpass API (with retry strategy)."""
+    """
+    Send Overpass QL to the Overpass API (with retry strategy).
+    Within a request deadline, requests and retries stop when it would be
+    exceeded and DeadlineExceeded is raised.
+    """
 
     max_timeout_retries = 4
     max_rate_limit_retries = 4
@@ -161,9 +212,14 @@ async def fetch_overpass_data(query: str) -> List[OverpassElement]:
     ):
         try:
             print(f"➡️ Attempt {num_timeouts + num_rate_limits + 1}...")
+            _check_overpass_budget()
+            left = remaining()
 
-            async with httpx.AsyncClient(timeout=50.0) as client:
-                response = await client.post(OVERPASS_URL, data={"data": query})
+            with timer("overpass_request"):
+                async with httpx.AsyncClient(
+                    timeout=50.0 if left is None else min(50.0, left)
+                ) as client:
+                    response = await client.post(OVERPASS_URL, data={"data": query})
 
             # Check HTTP status
             if response.status_code == 200:
@@ -175,6 +231,7 @@ async def fetch_overpass_data(query: str) -> List[OverpassElement]:
                 print(
                     f"⚠️ Overpass Timeout (504). Retrying in {timeout_delay_seconds}s..."
                 )
+                _check_overpass_budget(timeout_delay_seconds)
                 await asyncio.sleep(timeout_delay_seconds)
                 timeout_delay_seconds *= 2
                 num_timeouts += 1
@@ -182,6 +239,7 @@ async def fetch_overpass_data(query: str) -> List[OverpassElement]:
                 print(
                     f"⚠️ Overpass Rate Limit Exceeded (429). Retrying in {rate_limit_delay_seconds}s..."
                 )
+                _check_overpass_budget(rate_limit_delay_seconds)
                 await asyncio.sleep(rate_limit_delay_seconds)
                 rate_limit_delay_seconds *= 2
                 num_rate_limits += 1
@@ -191,9 +249,11 @@ async def fetch_overpass_data(query: str) -> List[OverpassElement]:
                     f"❌ Overpass error {response.status_code}: {response.text[:200]}"
                 )
 
-        except (httpx.ConnectError, httpx.ReadTimeout):
-            # Retry for network errors
+        except httpx.TransportError:
+            # Retry for network errors and timeouts (connect, read, write, pool);
+            # the timeouts get short once the request deadline draws near
             print(f"⚠️ Network error. Retrying in {timeout_delay_seconds}s...")
+            _check_overpass_budget(timeout_delay_seconds)
             await asyncio.sleep(timeout_delay_seconds)
             timeout_delay_seconds *= 2
             num_timeouts += 1
@@ -206,6 +266,7 @@ async def fetch_overpass_data(query: str) -> List[OverpassElement]:
 
 async def get_amenities_in_polygon_postgres(
     engine: Engine,
+    region: str,
     polygon: Polygon,
     query_point: Point,
     amenity_state: dict,
@@ -234,7 +295,8 @@ async def get_amenities_in_polygon_postgres(
                     ORDER BY geometry <-> ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)
                 ) AS rn
                                FROM amenities
-                               WHERE amenity = ANY (:enabled_amenities)
+                               WHERE region = :region
+                                 AND amenity = ANY (:enabled_amenities)
                                  AND ST_Within(
                                        geometry,
                                        ST_GeomFromText(:polygon_wkt, 4326)
@@ -251,18 +313,178 @@ async def get_amenities_in_polygon_postgres(
                """
     )
 
-    with engine.connect() as conn:
-        result = conn.execute(
-            sql,
+    with timer("amenity_query"), engine.connect() as conn:
+        apply_statement_timeout(conn)
+        try:
+            result = conn.execute(
+                sql,
+                {
+                    "region": region,
+                    "lon": lon,
+                    "lat": lat,
+                    "polygon_wkt": polygon_wkt,
+                    "enabled_amenities": enabled_amenities,
+                },
+            )
+        except DBAPIError as e:
+            if not is_statement_timeout(e):
+                raise
+            # Out of time: answer without amenities rather than not at all
+            mark_degraded("amenities")
+            return []
+
+        return [
             {
-                "lon": lon,
-                "lat": lat,
-                "polygon_wkt": polygon_wkt,
-                "enabled_amenities": enabled_amenities,
-            },
+                "id": row.id,
+                "name": row.name,
+                "amenity": row.amenity,
+                "cuisine": row.cuisine,
+                "lat": round(row.lat, COORDINATE_PRECISION),
+                "lon": round(row.lon, COORDINATE_PRECISION),
+                "distance": round(row.distance, 1),
+            }
+            for row in result
+        ]
+
+
+async def find_amenities_in_polygon(
+    engine: Engine,
+    region: str,
+    polygon: Polygon,
+    query_point: Point,
+    amenity_state: dict,
+):
+    """
+    Amenities in a polygon, answered in-process from the region's POI snapshot.
+    Falls back to PostGIS if no snapshot was exported.
+    """
+    snapshot = get_snapshot(region)
+    if snapshot is None:
+        return await get_amenities_in_polygon_postgres(
+            engine, region, polygon, query_point, amenity_state
+        )
+
+    with timer("amenity_snapshot_query"):
+        return snapshot.query(
+            polygon,
+            query_point,
+            extract_enabled_amenities(amenity_state),
+            COORDINATE_PRECISION,
         )
 
-        return result.mappings().all()
+
+def get_amenities_in_polygons_postgres(
+    engine: Engine,
+    areas: list[tuple[str, bytes, Point]],
+    enabled_amenities: list[str],
+) -> list[list[dict]]:
+    """
+    Amenities within several polygons in one query.
+    Args:
+        areas: (region, polygon as WKB, query point) per location.
+        enabled_amenities: Amenity types to return.
+    Returns:
+        Per area, its amenities ordered by amenity and distance to its query point.
+    """
+    results: list[list[dict]] = [[] for _ in areas]
+    if not areas or not enabled_amenities:
+        return results
+
+    sql = text(
+        """
+        WITH areas AS (
+            SELECT
+                idx,
+                region,
+                ST_GeomFromWKB(wkb, 4326) AS polygon,
+                ST_SetSRID(ST_MakePoint(lon, lat), 4326)::geography AS origin
+            FROM unnest(
+                CAST(:idx AS integer[]),
+                CAST(:regions AS text[]),
+                CAST(:wkbs AS bytea[]),
+                CAST(:lons AS double precision[]),
+                CAST(:lats AS double precision[])
+            ) AS a (idx, region, wkb, lon, lat)
+        )
+        SELECT
+            areas.idx,
+            amenities.id,
+            amenities.name,
+            amenities.amenity,
+            amenities.cuisine,
+            ST_Y(amenities.geometry) AS lat,
+            ST_X(amenities.geometry) AS lon,
+            ST_Distance(amenities.geometry::geography, areas.origin) AS distance
+        FROM areas
+        JOIN amenities
+            ON amenities.region = areas.region
+            AND amenities.amenity = ANY (:enabled_amenities)
+            AND ST_Within(amenities.geometry, areas.polygon)
+        ORDER BY areas.idx, amenities.amenity, distance
+        """
+    )
+
+    with timer("amenity_query"), engine.connect() as conn:
+        apply_statement_timeout(conn)
+        try:
+            rows = conn.execute(
+                sql,
+                {
+                    "idx": list(range(len(areas))),
+                    "regions": [region for region, _, _ in areas],
+                    "wkbs": [wkb for _, wkb, _ in areas],
+                    "lons": [point.x for _, _, point in areas],
+                    "lats": [point.y for _, _, point in areas],
+                    "enabled_amenities": enabled_amenities,
+                },
+            )
+        except DBAPIError as e:
+            if not is_statement_timeout(e):
+                raise
+            mark_degraded("amenities")
+            return results
+
+        for row in rows:
+            results[row.idx].append(
+                {
+                    "id": row.id,
+                    "name": row.name,
+                    "amenity": row.amenity,
+                    "cuisine": row.cuisine,
+                    "lat": round(row.lat, COORDINATE_PRECISION),
+                    "lon": round(row.lon, COORDINATE_PRECISION),
+                    "distance": round(row.distance, 1),
+                }
+            )
+
+    return results
+
+
+async def find_amenities_in_polygons(
+    engine: Engine,
+    areas: list[tuple[str, Polygon, bytes, Point]],
+    enabled_amenities: list[str],
+) -> list[list[dict]]:
+    """
+    Amenities within several polygons: from the POI snapshots if every region
+    has one, otherwise all areas at once in a single PostGIS query.
+    Args:
+        areas: (region, polygon, polygon as WKB, query point) per location.
+    """
+    snapshots = [get_snapshot(region) for region, _, _, _ in areas]
+    if all(snapshot is not None for snapshot in snapshots):
+        with timer("amenity_snapshot_query"):
+            return [
+                snapshot.query(polygon, point, enabled_amenities, COORDINATE_PRECISION)
+                for snapshot, (_, polygon, _, point) in zip(snapshots, areas)
+            ]
+
+    return await asyncio.to_thread(
+        get_amenities_in_polygons_postgres,
+        engine,
+        [(region, wkb, point) for region, _, wkb, point in areas],
+        enabled_amenities,
+    )
 
 
 async def get_amenities_in_polygon(polygon: str) -> list[OverpassElement]:
@@ -294,14 +516,92 @@ async def get_amenities_in_polygon(polygon: str) -> list[OverpassElement]:
     return elements
 
 
-def get_all_pois_postgres(engine: Engine):
+def get_amenities_in_polygon_local(engine: Engine, polygon: str) -> list[OverpassElement]:
     """
-    Get all pois for heatmap
-    :param engine:
-    :return:
+    Amenities in a polygon (format: "lat lon lat lon ...") from the local
+    amenities table, shaped like Overpass elements. Used when Overpass cannot
+    answer within the request deadline; empty if this query times out as well.
+    """
+    values = [float(v) for v in polygon.split()]
+    polygon_wkt = Polygon(list(zip(values[1::2], values[0::2]))).wkt
+
+    with timer("amenity_query"), engine.connect() as conn:
+        apply_statement_timeout(conn)
+        try:
+            rows = conn.execute(
+                text(
+                    """
+                    SELECT id, name, amenity, cuisine, ST_Y(geometry) AS lat, ST_X(geometry) AS lon
+                    FROM amenities
+                    WHERE ST_Within(geometry, ST_GeomFromText(:polygon_wkt, 4326))
+                    ORDER BY id
+                    """
+                ),
+                {"polygon_wkt": polygon_wkt},
+            )
+        except DBAPIError as e:
+            # Runs once the deadline is (nearly) over, so with the minimum timeout
+            if not is_statement_timeout(e):
+                raise
+            mark_degraded("amenities")
+            return []
+
+        return [
+            OverpassElement(
+                type="node",
+                id=row.id,
+                lat=row.lat,
+                lon=row.lon,
+                tags={"name": row.name, "amenity": row.amenity, "cuisine": row.cuisine},
+            )
+            for row in rows
+        ]
+
+
+def build_pois_query(
+    region: Optional[str] = None,
+    bbox: Optional[tuple[float, float, float, float]] = None,
+    amenities: Optional[list[str]] = None,
+    after: Optional[int] = None,
+    limit: Optional[int] = None,
+):
     """
+    Build the heatmap POI query with optional filters.
+    Paginated queries (after/limit) are ordered by id for keyset pagination:
+    the next page starts after the id of the last POI of the previous one.
+    Ids are only unique within a region, so these need a region.
+    """
+    paginated = after is not None or limit is not None
+    if paginated and region is None:
+        raise ValueError("Paginated POI queries need a region")
+
+    conditions = []
+    params: Dict[str, Any] = {}
+
+    if region is not None:
+        conditions.append("region = :region")
+        params["region"] = region
+    if bbox is not None:
+        conditions.append(
+            "geometry && ST_MakeEnvelope(:min_lon, :min_lat, :max_lon, :max_lat, 4326)"
+        )
+        params.update(zip(("min_lon", "min_lat", "max_lon", "max_lat"), bbox))
+    if amenities:
+        conditions.append("amenity = ANY (:amenities)")
+        params["amenities"] = amenities
+    if after is not None:
+        conditions.append("id > :after")
+        params["after"] = after
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    order_by = "id" if paginated else "amenity, name"
+    limit_clause = ""
+    if limit is not None:
+        limit_clause = "LIMIT :limit"
+        params["limit"] = limit
+
     sql = text(
-        """
+        f"""
         SELECT
             id,
             name,
@@ -310,10 +610,53 @@ def get_all_pois_postgres(engine: Engine):
             ST_Y(geometry) AS lat,
             ST_X(geometry) AS lon
         FROM amenities
-        ORDER BY amenity, name;
+        {where}
+        ORDER BY {order_by}
+        {limit_clause};
     """
     )
+    return sql, params
+
+
+def poi_row_to_dict(row) -> Dict[str, Any]:
+    return {
+        "id": row.id,
+        "name": row.name,
+        "amenity": row.amenity,
+        "cuisine": row.cuisine,
+        "lat": round(row.lat, COORDINATE_PRECISION),
+        "lon": round(row.lon, COORDINATE_PRECISION),
+    }
+
+
+def get_all_pois_postgres(engine: Engine, **filters):
+    """
+    Get all pois for heatmap
+    :param engine:
+    :param filters: region, bbox, amenities, after, limit (see build_pois_query)
+    :return:
+    """
+    sql, params = build_pois_query(**filters)
+
+    with timer("poi_query"), engine.connect() as conn:
+        result = conn.execute(sql, params)
+        return [poi_row_to_dict(row) for row in result]
+
+
+def stream_pois_postgres(
+    engine: Engine, batch_size: int = POI_STREAM_BATCH_SIZE, **filters
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Stream pois for heatmap in batches, using a server-side cursor.
+    Only one batch is held in memory at a time, regardless of the table size.
+    :param engine:
+    :param batch_size: number of rows fetched from the cursor at once
+    :param filters: region, bbox, amenities, after, limit (see build_pois_query)
+    :return: iterator over lists of POI dicts
+    """
+    sql, params = build_pois_query(**filters)
 
     with engine.connect() as conn:
-        result = conn.execute(sql)
-        return result.mappings().all()
+        result = conn.execution_options(yield_per=batch_size).execute(sql, params)
+        for partition in result.partitions():
+            yield [poi_row_to_dict(row) for row in partition]
@@ -0,0 +1,256 @@
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Optional
+
+import numpy as np
+import pyproj
+import shapely
+from shapely.geometry import Point, Polygon
+from sqlalchemy import Engine, text
+
+from .regions import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Columnar snapshots of the amenities table, exported by poi_download.py.
+# Layout: <POI_SNAPSHOT_DIR>/<region>/<version>/*.npy, plus
+# <POI_SNAPSHOT_DIR>/<region>/CURRENT naming the active version.
+# Workers map the arrays read-only, so all of them share the same pages.
+POI_SNAPSHOT_DIR = Path(os.getenv("POI_SNAPSHOT_DIR", str(DATA_DIR / "snapshots")))
+# How often (seconds) workers check whether a new snapshot version was exported
+POI_SNAPSHOT_CHECK_SECONDS = float(os.getenv("POI_SNAPSHOT_CHECK_SECONDS", "5"))
+
+CURRENT_FILE = "CURRENT"
+META_FILE = "meta.json"
+ARRAYS = ["ids", "amenity", "lon", "lat", "name_offsets", "cuisine_offsets"]
+# Distances as PostGIS computes them for geography: geodesics on WGS84
+GEOD = pyproj.Geod(ellps="WGS84")
+
+
+def _encode_strings(values: list[Optional[str]]) -> tuple[bytes, np.ndarray]:
+    """Pack strings into one UTF-8 blob plus offsets (None is stored as empty)."""
+    encoded = [(v or "").encode() for v in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return b"".join(encoded), offsets
+
+
+def export_snapshot(engine: Engine, region: str) -> Path:
+    """
+    Export the amenities of a region and make the export the current snapshot.
+    Returns the snapshot directory.
+    """
+    with engine.connect() as conn:
+        rows = conn.execute(
+            text(
+                """
+                SELECT
+                    id,
+                    amenity,
+                    name,
+                    cuisine,
+                    ST_X(geometry) AS lon,
+                    ST_Y(geometry) AS lat
+                FROM amenities
+                WHERE region = :region
+                ORDER BY id
+                """
+            ),
+            {"region": region},
+        ).all()
+
+    region_dir = POI_SNAPSHOT_DIR / region
+    version = datetime.now().strftime("%Y%m%dT%H%M%S%f")
+    tmp_dir = region_dir / f"{version}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+
+    lon = np.array([row.lon for row in rows], dtype=np.float64)
+    lat = np.array([row.lat for row in rows], dtype=np.float64)
+
+    # Sorted, so that ordering by code equals ordering by amenity name
+    amenity_codes = sorted({row.amenity or "" for row in rows})
+    code_of = {amenity: code for code, amenity in enumerate(amenity_codes)}
+
+    names, name_offsets = _encode_strings([row.name for row in rows])
+    cuisines, cuisine_offsets = _encode_strings([row.cuisine for row in rows])
+
+    arrays = {
+        "ids": np.array([row.id for row in rows], dtype=np.int64),
+        "amenity": np.array(
+            [code_of[row.amenity or ""] for row in rows], dtype=np.int32
+        ),
+        "lon": lon,
+        "lat": lat,
+        "name_offsets": name_offsets,
+        "cuisine_offsets": cuisine_offsets,
+    }
+    for name, array in arrays.items():
+        np.save(tmp_dir / f"{name}.npy", array)
+    (tmp_dir / "names.bin").write_bytes(names)
+    (tmp_dir / "cuisines.bin").write_bytes(cuisines)
+    (tmp_dir / META_FILE).write_text(
+        json.dumps(
+            {
+                "region": region,
+                "version": version,
+                "count": len(rows),
+                "amenity_codes": amenity_codes,
+            }
+        )
+    )
+
+    snapshot_dir = region_dir / version
+    shutil.rmtree(snapshot_dir, ignore_errors=True)
+    tmp_dir.rename(snapshot_dir)
+
+    # Atomically switch workers over to the new version
+    current_tmp = region_dir / f"{CURRENT_FILE}.tmp"
+    current_tmp.write_text(version)
+    os.replace(current_tmp, region_dir / CURRENT_FILE)
+
+    # Workers still mapping an old version keep their pages after unlinking,
+    # but keep the previous version around for workers that have not swapped yet.
+    versions = sorted(
+        p for p in region_dir.iterdir() if p.is_dir() and not p.name.endswith(".tmp")
+    )
+    for old in versions[:-2]:
+        shutil.rmtree(old, ignore_errors=True)
+
+    logger.info(f"Exported POI snapshot {snapshot_dir} ({len(rows)} amenities)")
+    return snapshot_dir
+
+
+class PoiSnapshot:
+    def __init__(self, path: Path):
+        self.path = path
+        self.meta = json.loads((path / META_FILE).read_text())
+        self.version = self.meta["version"]
+
+        for name in ARRAYS:
+            setattr(self, name, np.load(path / f"{name}.npy", mmap_mode="r"))
+        self.names = self._load_blob(path / "names.bin", self.name_offsets)
+        self.cuisines = self._load_blob(path / "cuisines.bin", self.cuisine_offsets)
+
+        self.amenity_codes: list[str] = self.meta["amenity_codes"]
+        self.code_of = {amenity: code for code, amenity in enumerate(self.amenity_codes)}
+        # The index is per process; the coordinate arrays themselves are shared
+        self.tree = shapely.STRtree(shapely.points(self.lon, self.lat))
+
+    @staticmethod
+    def _load_blob(path: Path, offsets) -> Optional[np.memmap]:
+        # np.memmap cannot map empty files
+        if offsets[-1] == 0:
+            return None
+        return np.memmap(path, dtype=np.uint8, mode="r")
+
+    def _string(self, blob, offsets, index: int) -> Optional[str]:
+        start, end = offsets[index], offsets[index + 1]
+        if blob is None or start == end:
+            return None
+        return blob[start:end].tobytes().decode()
+
+    def query(
+        self,
+        polygon: Polygon,
+        query_point: Point,
+        enabled_amenities: list[str],
+        precision: int,
+    ) -> list[dict[str, Any]]:
+        """
+        Amenities of the enabled types within the polygon, ordered by amenity and
+        geodesic distance to the query point, computed like ST_Distance on
+        geography in the PostGIS query.
+        """
+        codes = [self.code_of[a] for a in enabled_amenities if a in self.code_of]
+        if not codes:
+            return []
+
+        index = self.tree.query(polygon, predicate="contains")
+        index = index[np.isin(self.amenity[index], codes)]
+
+        _, _, distance = GEOD.inv(
+            np.full(len(index), query_point.x),
+            np.full(len(index), query_point.y),
+            self.lon[index],
+            self.lat[index],
+        )
+
+        order = np.lexsort((distance, self.amenity[index]))
+        index, distance = index[order], distance[order]
+
+        ids = self.ids[index].tolist()
+        amenities = self.amenity[index].tolist()
+        lats = np.round(self.lat[index], precision).tolist()
+        lons = np.round(self.lon[index], precision).tolist()
+        distances = np.round(distance, 1).tolist()
+
+        return [
+            {
+                "id": ids[i],
+                "name": self._string(self.names, self.name_offsets, row),
+                "amenity": self.amenity_codes[amenities[i]],
+                "cuisine": self._string(self.cuisines, self.cuisine_offsets, row),
+                "lat": lats[i],
+                "lon": lons[i],
+                "distance": distances[i],
+            }
+            for i, row in enumerate(index.tolist())
+        ]
+
+
+# region -> (snapshot or None, time of the last CURRENT check)
+_snapshots: dict[str, tuple[Optional[PoiSnapshot], float]] = {}
+_snapshots_lock = threading.Lock()
+# One lock per region, so loading a region's new snapshot (and building its
+# STRtree) does not stall the snapshot lookups of other regions.
+_region_locks: dict[str, threading.Lock] = {}
+
+
+def get_snapshot(region: str) -> Optional[PoiSnapshot]:
+    """
+    The current snapshot of a region, or None if none was exported.
+    A newly exported version is picked up within POI_SNAPSHOT_CHECK_SECONDS;
+    while it is loaded, the previous one (or None) keeps answering.
+    """
+    now = time.monotonic()
+    snapshot, checked_at = _snapshots.get(region, (None, -float("inf")))
+    if now - checked_at < POI_SNAPSHOT_CHECK_SECONDS:
+        return snapshot
+
+    region_lock = _region_locks.setdefault(region, threading.Lock())
+    if not region_lock.acquire(blocking=False):
+        # Another thread is checking or loading; don't wait for it
+        return snapshot
+
+    try:
+        snapshot, checked_at = _snapshots.get(region, (None, -float("inf")))
+        if now - checked_at < POI_SNAPSHOT_CHECK_SECONDS:
+            return snapshot
+
+        current_file = POI_SNAPSHOT_DIR / region / CURRENT_FILE
+        try:
+            version = current_file.read_text().strip()
+        except FileNotFoundError:
+            version = None
+
+        if version is None:
+            snapshot = None
+        elif snapshot is None or snapshot.version != version:
+            try:
+                snapshot = PoiSnapshot(POI_SNAPSHOT_DIR / region / version)
+                logger.info(f"Loaded POI snapshot {region}/{version}")
+            except (OSError, ValueError, KeyError):
+                logger.exception(f"Could not load POI snapshot {region}/{version}")
+
+        with _snapshots_lock:
+            _snapshots[region] = (snapshot, now)
+        return snapshot
+    finally:
+        region_lock.release()
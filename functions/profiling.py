@@ -0,0 +1,181 @@
+import asyncio
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+from .regions import DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+# Requests sending this token in PROFILE_HEADER are always profiled
+# (unset: only PROFILE_SAMPLE_RATE applies)
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN")
+PROFILE_HEADER = "x-profile-token"
+# Fraction of all requests profiled without the header (0 disables sampling)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_INTERVAL_SECONDS = float(os.getenv("PROFILE_INTERVAL_SECONDS", "0.005"))
+PROFILE_DIR = Path(os.getenv("PROFILE_DIR", str(DATA_DIR / "profiles")))
+# Number of profile files kept, oldest deleted first
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "50"))
+
+PROFILE_SUFFIX = ".speedscope.json"
+PROFILE_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_-]+\.speedscope\.json$")
+
+# At most one request is profiled at a time, which bounds the overhead
+_profiling_lock = threading.Lock()
+
+
+def has_profile_token(headers) -> bool:
+    if not PROFILE_TOKEN:
+        return False
+    return hmac.compare_digest(headers.get(PROFILE_HEADER, ""), PROFILE_TOKEN)
+
+
+def should_profile(headers) -> bool:
+    if has_profile_token(headers):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of all threads from a background thread, so work
+    in the thread pool is covered as well as the event loop. While R5 runs in
+    the JVM, the calling r5py frames stay on the stack, so JVM time shows up
+    under them.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.frames: list[dict] = []
+        self._frame_ids: dict[tuple, int] = {}
+        # thread id -> (stacks, weights)
+        self.samples: dict[int, tuple[list[list[int]], list[float]]] = {}
+        self.thread_names: dict[int, str] = {}
+        self.started_at = 0.0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profiler", daemon=True)
+
+    def _frame_id(self, code) -> int:
+        key = (code.co_name, code.co_filename, code.co_firstlineno)
+        frame_id = self._frame_ids.get(key)
+        if frame_id is None:
+            frame_id = self._frame_ids[key] = len(self.frames)
+            self.frames.append(
+                {"name": code.co_name, "file": code.co_filename, "line": code.co_firstlineno}
+            )
+        return frame_id
+
+    def _sample(self, weight: float):
+        own_id = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._frame_id(frame.f_code))
+                frame = frame.f_back
+            stack.reverse()
+            stacks, weights = self.samples.setdefault(thread_id, ([], []))
+            stacks.append(stack)
+            weights.append(weight)
+
+    def _run(self):
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            now = time.perf_counter()
+            self._sample(now - last)
+            last = now
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+        self.thread_names = {t.ident: t.name for t in threading.enumerate()}
+
+    def to_speedscope(self, name: str) -> dict:
+        """The samples in speedscope's file format, one profile per thread."""
+        profiles = [
+            {
+                "type": "sampled",
+                "name": self.thread_names.get(thread_id, f"thread {thread_id}"),
+                "unit": "seconds",
+                "startValue": 0,
+                "endValue": sum(weights),
+                "samples": stacks,
+                "weights": weights,
+            }
+            for thread_id, (stacks, weights) in self.samples.items()
+        ]
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "15-min-city-api",
+            "activeProfileIndex": 0,
+            "shared": {"frames": self.frames},
+            "profiles": profiles,
+        }
+
+
+def prune_profiles(keep: int = PROFILE_KEEP):
+    files = sorted(PROFILE_DIR.glob(f"*{PROFILE_SUFFIX}"))
+    for old in files[: max(0, len(files) - keep)]:
+        old.unlink(missing_ok=True)
+
+
+def save_profile(sampler: StackSampler, name: str, description: str):
+    """Stop the sampler and write its profile to PROFILE_DIR."""
+    sampler.stop()
+    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+    (PROFILE_DIR / name).write_text(
+        json.dumps(sampler.to_speedscope(f"{description} ({sampler.duration:.3f}s)"))
+    )
+    prune_profiles()
+    logger.info(f"Profiled {description} in {sampler.duration:.3f}s: {name}")
+
+
+@asynccontextmanager
+async def profile_request(description: str) -> AsyncIterator[Optional[str]]:
+    """
+    Profile everything the process does while the block runs and save it as a
+    speedscope file. Yields the file name, or None if another request is
+    already being profiled.
+    """
+    if not _profiling_lock.acquire(blocking=False):
+        yield None
+        return
+
+    try:
+        name = datetime.now().strftime("%Y%m%dT%H%M%S%f") + PROFILE_SUFFIX
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            yield name
+        finally:
+            # Serializing a profile takes long enough to stall other requests
+            await asyncio.to_thread(save_profile, sampler, name, description)
+    finally:
+        _profiling_lock.release()
+
+
+def profile_path(name: str) -> Optional[Path]:
+    """Path of a saved profile, or None for unknown or invalid names."""
+    if not PROFILE_NAME_PATTERN.match(name):
+        return None
+    path = PROFILE_DIR / name
+    return path if path.exists() else None
@@ -1,30 +1,73 @@
+import asyncio
+import contextvars
 import os
 import sys
 import logging
-import time
-from contextlib import contextmanager
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+import time as time_module
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import cached_property
 
 from sqlalchemy import Engine, text
+from sqlalchemy.exc import DBAPIError
 
 sys.argv.append(["--max-memory", "99%"])  # Before r5py for performance
 
 from geojson import GeoJSON
-from typing import Literal
+from typing import Literal, Optional
 from pathlib import Path
-from r5py import Isochrones, TransportNetwork, TransportMode
-from shapely.geometry import Point, MultiPoint, mapping
-import json
+from datetime import timedelta
+import geopandas as gpd
+import numpy as np
+from r5py import TravelTimeMatrix, TransportNetwork, TransportMode
+import pyproj
+import shapely
+from shapely.geometry import Point, mapping, shape
+from shapely.ops import transform
+import orjson
 from shapely.geometry.base import BaseGeometry
 from shapely.geometry.polygon import Polygon
 import pyrosm
 
+from .metrics import timer, record_cache_result
+from .serialization import COORDINATE_PRECISION, round_coordinates
+from .surfaces import (
+    EMPTY_POLYGON,
+    build_destination_grid,
+    cache_surface,
+    find_surface,
+    get_cached_surface,
+    isochrone_from_surface,
+    make_surface,
+    save_surface_to_db,
+    surface_max_time,
+)
+from .regions import get_region, utm_crs_for
+from .cache import ISOCHRONE_TTL, record_isochrone_hit
+from .network_cache import MAX_RESIDENT_NETWORKS, NETWORK_IDLE_SECONDS, load_cached_network
+from .graph_router import get_street_graph, uses_graph_router
+from .deadline import (
+    DEADLINE_RESERVE_SECONDS,
+    MIN_STATEMENT_TIMEOUT_SECONDS,
+    DeadlineExceeded,
+    apply_statement_timeout,
+    check_deadline,
+    is_statement_timeout,
+    mark_degraded,
+    remaining,
+)
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Type alias for modes
 Mode = Literal["walk", "bike", "car"]
 
-ISOCHRONE_TTL = "1 day"  # PostgreSQL interval
+# Origins are rounded to this many decimals (4 ≈ 10 m) before lookup and
+# routing, so nearby clicks share one cache row instead of adding new ones.
+ISOCHRONE_ORIGIN_DECIMALS = int(os.getenv("ISOCHRONE_ORIGIN_DECIMALS", "4"))
 # Constants
 MODES: list[Mode] = ["walk", "bike", "car"]
 TIME_DEFAULT = 15
@@ -36,162 +79,686 @@ MODE_TO_R5PY_TRANSPORT_MODE: dict[Mode, TransportMode] = {
     "car": TransportMode.CAR,
 }
 
-BASE_DIR = Path(__file__).parent.parent
-DATA_DIR = BASE_DIR / "data"
+# Average network speeds incl. detours, for the instant approximate isochrone
+MODE_APPROXIMATE_SPEED_MPS: dict[Mode, float] = {
+    "walk": 4.5 / 3.6,
+    "bike": 13 / 3.6,
+    "car": 25 / 3.6,
+}
+
+# Threads computing isochrones for requests. Kept apart from asyncio's default
+# executor, so routing runs abandoned at their deadline cannot starve the
+# quick fallback lookups.
+ROUTING_WORKERS = int(os.getenv("ROUTING_WORKERS", "4"))
+_routing_executor = ThreadPoolExecutor(
+    max_workers=ROUTING_WORKERS, thread_name_prefix="routing"
+)
+
+# Calls in progress, shared by concurrent requests for the same work:
+# (region, mode, lon, lat, max_time) -> surface being routed
+_surface_calls: dict[tuple, Future] = {}
+# (region, mode, lon, lat, time) -> route_isochrone running in _routing_executor
+_isochrone_calls: dict[tuple, Future] = {}
+_calls_lock = threading.Lock()
 
-DEBUG_TIMING = os.getenv("DEBUG_TIMING", "false").lower() == "true"
+# region -> (network, last used); ordered from least to most recently used
+_networks: "OrderedDict[str, tuple[TransportNetwork, float]]" = OrderedDict()
+_networks_lock = threading.Lock()
+# One lock per region, so a region's network is only built once at a time
+# without blocking requests for other regions.
+_region_locks: dict[str, threading.Lock] = {}
+
+
+def load_transport_network(region: str) -> TransportNetwork:
+    pbf_file = get_region(region).find_pbf()
+    if pbf_file is None:
+        raise FileNotFoundError(f"No .osm.pbf file found for region '{region}'")
+
+    logger.info(f"Loading from file: {pbf_file}")
+    return load_cached_network(region, pbf_file)
+
+
+def evict_idle_networks():
+    """Drop networks that were not used for NETWORK_IDLE_SECONDS."""
+    now = time_module.monotonic()
+    with _networks_lock:
+        for region, (_, last_used) in list(_networks.items()):
+            if now - last_used > NETWORK_IDLE_SECONDS:
+                logger.info(f"Evicting idle transport network '{region}'")
+                del _networks[region]
+
+
+def get_transport_network(region: str) -> TransportNetwork:
+    """
+    Get the transport network of a region, loading it on first use.
+    Memory scales with the number of active regions, not configured ones.
+    """
+    with _region_locks.setdefault(region, threading.Lock()):
+        with _networks_lock:
+            entry = _networks.pop(region, None)
+            if entry is not None:
+                network = entry[0]
+                _networks[region] = (network, time_module.monotonic())
 
+        if entry is None:
+            network = load_transport_network(region)
+
+            with _networks_lock:
+                _networks[region] = (network, time_module.monotonic())
+                while len(_networks) > MAX_RESIDENT_NETWORKS:
+                    evicted, _ = _networks.popitem(last=False)
+                    logger.info(f"Evicting least recently used transport network '{evicted}'")
+
+    # Also on hits: while one region is busy, the others must still go idle
+    evict_idle_networks()
+    return network
+
+
+def snap_origin(longitude: float, latitude: float) -> tuple[float, float]:
+    return (
+        round(longitude, ISOCHRONE_ORIGIN_DECIMALS),
+        round(latitude, ISOCHRONE_ORIGIN_DECIMALS),
+    )
+
+
+def approximate_isochrone(
+    region: str, longitude: float, latitude: float, mode: Mode, time: int
+) -> GeoJSON:
+    """
+    An instant stand-in for calculate_isochrone without routing or database access:
+    derived from an in-memory travel-time surface of the origin if there is one,
+    otherwise a circle of the distance covered at the mode's average speed.
+    """
+    longitude, latitude = snap_origin(longitude, latitude)
+
+    surface = get_cached_surface(region, mode, longitude, latitude, time)
+    if surface is not None:
+        return isochrone_from_surface(surface, time)
+
+    crs = utm_crs_for(longitude, latitude)
+    to_utm = pyproj.Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+    to_wgs84 = pyproj.Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+
+    center = transform(to_utm.transform, Point(longitude, latitude))
+    circle = center.buffer(MODE_APPROXIMATE_SPEED_MPS[mode] * time, quad_segs=8)
+    return round_coordinates(mapping(transform(to_wgs84.transform, circle)))
+
+
+def route_travel_time_surface(
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    max_time_seconds: int,
+) -> np.ndarray:
+    """
+    Route once from the origin to a grid of destinations and keep every
+    destination reachable within max_time_seconds with its travel time.
+    Modes in GRAPH_ROUTER_MODES are routed in-process instead of by r5py.
+    """
+    if uses_graph_router(mode):
+        with timer("graph_load"):
+            graph = get_street_graph(region, mode)
+        check_deadline("graph_compute")
+        with timer("graph_compute"):
+            return graph.travel_time_surface(longitude, latitude, max_time_seconds)
+
+    return route_travel_time_surface_r5py(
+        region, longitude, latitude, mode, max_time_seconds
+    )
+
+
+def route_travel_time_surface_r5py(
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    max_time_seconds: int,
+    resolution: Optional[float] = None,
+    sample_ratio: Optional[float] = None,
+) -> np.ndarray:
+    """
+    route_travel_time_surface with r5py's TravelTimeMatrix. The destination
+    grid adapts to the reachable area unless resolution and sample_ratio are given.
+    """
+    with timer("network_load"):
+        network = get_transport_network(region)
+
+    check_deadline("r5py_compute")
+    lon, lat = build_destination_grid(
+        longitude, latitude, mode, max_time_seconds, resolution, sample_ratio
+    )
+    destinations = gpd.GeoDataFrame(
+        {"id": np.arange(len(lon))},
+        geometry=gpd.points_from_xy(lon, lat),
+        crs="EPSG:4326",
+    )
+    origins = gpd.GeoDataFrame(
+        {"id": [0]}, geometry=[Point(longitude, latitude)], crs="EPSG:4326"
+    )
+
+    with timer("r5py_compute"):
+        travel_times = TravelTimeMatrix(
+            network,
+            origins=origins,
+            destinations=destinations,
+            transport_modes=[MODE_TO_R5PY_TRANSPORT_MODE[mode]],
+            max_time=timedelta(seconds=max_time_seconds),
+        )
+
+    reached = travel_times.dropna(subset=["travel_time"])
+    ids = reached["to_id"].to_numpy(dtype=np.int64)
+    # r5py reports whole minutes
+    return make_surface(
+        lon[ids], lat[ids], reached["travel_time"].to_numpy() * 60
+    )
+
+
+def route_surface_once(
+    engine: Engine,
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    max_time_seconds: int,
+) -> np.ndarray:
+    """
+    route_travel_time_surface, then cache and store the surface. Concurrent
+    calls for the same origin wait for the first one instead of routing again.
+    """
+    key = (region, mode, longitude, latitude, max_time_seconds)
+    with _calls_lock:
+        future = _surface_calls.get(key)
+        owner = future is None
+        if owner:
+            future = _surface_calls[key] = Future()
+    if not owner:
+        return future.result()
 
-@contextmanager
-def timer(label: str):
-    if not DEBUG_TIMING:
-        yield
-        return
-    start = time.perf_counter()
     try:
-        yield
+        surface = route_travel_time_surface(
+            region, longitude, latitude, mode, max_time_seconds
+        )
+        cache_surface(region, mode, longitude, latitude, max_time_seconds, surface)
+        save_surface_to_db(
+            engine, region, mode, longitude, latitude, max_time_seconds, surface
+        )
+    except BaseException as e:
+        future.set_exception(e)
+        raise
+    else:
+        future.set_result(surface)
+        return surface
     finally:
-        end = time.perf_counter()
-        logger.info(f"[TIMING] {label}: {end - start:.3f} seconds")
+        with _calls_lock:
+            del _surface_calls[key]
 
 
-def load_transport_network(region: str) -> TransportNetwork:
-    region_dir = DATA_DIR / region
+@dataclass
+class Isochrone:
+    """A cached isochrone, in the two forms its consumers need."""
 
-    # Find the first .osm.pbf file in the folder
-    files = list(region_dir.glob("*.osm.pbf"))
-    if not files:
-        raise FileNotFoundError(f"No .osm.pbf file found for region '{region}'")
+    geojson: bytes  # serialized, precision-reduced GeoJSON, sent to clients as is
+    wkb: bytes
 
-    logger.info(f"Loading from file: {files[0]}")
-    return TransportNetwork(files[0])
+    @classmethod
+    def from_geojson(cls, geojson: GeoJSON) -> "Isochrone":
+        # The WKB is built from the rounded coordinates, so both forms agree
+        return cls(geojson=orjson.dumps(geojson), wkb=shapely.to_wkb(shape(geojson)))
 
+    @cached_property
+    def polygon(self) -> Polygon:
+        return shapely.from_wkb(self.wkb)
 
-def calculate_isochrone(
+    def to_geojson(self) -> GeoJSON:
+        return orjson.loads(self.geojson)
+
+
+def save_isochrone(
     engine: Engine,
+    region: str,
     longitude: float,
     latitude: float,
     mode: Mode,
     time: int,
-) -> GeoJSON:
+    isochrone: Isochrone,
+):
+    """Store an isochrone in the cache, replacing an older one of the same origin."""
+    with timer("db_save"):
+        with engine.begin() as conn:
+            conn.execute(
+                text(
+                    """
+                    INSERT INTO isochrones (
+                        region,
+                        mode,
+                        time_seconds,
+                        origin,
+                        geom,
+                        geojson,
+                        wkb,
+                        created_at
+                    )
+                    VALUES (
+                        :region,
+                        :mode,
+                        :time,
+                        ST_SetSRID(ST_MakePoint(:lon, :lat), 4326),
+                        ST_GeomFromWKB(:wkb, 4326),
+                        :geojson,
+                        :wkb,
+                        now()
+                    )
+                    ON CONFLICT (region, mode, time_seconds, origin)
+                    DO UPDATE SET
+                        geom = EXCLUDED.geom,
+                        geojson = EXCLUDED.geojson,
+                        wkb = EXCLUDED.wkb,
+                        created_at = now()
+                """
+                ),
+                {
+                    "region": region,
+                    "mode": mode,
+                    "time": time,
+                    "lon": longitude,
+                    "lat": latitude,
+                    "geojson": isochrone.geojson,
+                    "wkb": isochrone.wkb,
+                },
+            )
+
+
+def get_cached_isochrones(
+    engine: Engine,
+    origins: list[tuple[str, float, float]],
+    mode: Mode,
+    time: int,
+) -> list[Optional[Isochrone]]:
     """
-    Calculate the isochrone for a given longitude and latitude.
-    Returns a GeoJSON object with the isochrone polygon.
-    Args:
-        longitude: The longitude of the point.
-        latitude: The latitude of the point.
-        mode: The mode of transport.
-        time: The time in seconds.
-    Returns:
-        A GeoJSON object with the isochrone polygon.
+    Cache lookup of the isochrones of several (region, longitude, latitude)
+    origins in one query, counting the hits like lookup_isochrone.
+    Returns the isochrone or None (miss, or the query timed out) per origin.
+    """
+    results: list[Optional[Isochrone]] = [None] * len(origins)
+    # Origins snapping to the same cache row are looked up once
+    indices: dict[tuple[str, float, float], list[int]] = {}
+    for i, (region, longitude, latitude) in enumerate(origins):
+        indices.setdefault((region, *snap_origin(longitude, latitude)), []).append(i)
+    keys = list(indices)
+    if not keys:
+        return results
+
+    with timer("isochrone_cache_lookup"), engine.connect() as conn:
+        apply_statement_timeout(conn)
+        try:
+            rows = conn.execute(
+                text(
+                    """
+                    WITH origins AS (
+                        SELECT
+                            idx,
+                            region,
+                            ST_SetSRID(ST_MakePoint(lon, lat), 4326) AS origin
+                        FROM unnest(
+                            CAST(:idx AS integer[]),
+                            CAST(:regions AS text[]),
+                            CAST(:lons AS double precision[]),
+                            CAST(:lats AS double precision[])
+                        ) AS o (idx, region, lon, lat)
+                    )
+                    SELECT
+                        origins.idx,
+                        isochrones.id,
+                        COALESCE(
+                            isochrones.geojson,
+                            convert_to(ST_AsGeoJSON(isochrones.geom, :precision), 'UTF8')
+                        ) AS geojson,
+                        COALESCE(isochrones.wkb, ST_AsBinary(isochrones.geom)) AS wkb
+                    FROM origins
+                    JOIN isochrones
+                        ON isochrones.region = origins.region
+                        AND isochrones.mode = :mode
+                        AND isochrones.time_seconds = :time
+                        AND ST_Equals(isochrones.origin, origins.origin)
+                        AND isochrones.created_at >= now() - INTERVAL :ttl
+                    """
+                ),
+                {
+                    "idx": list(range(len(keys))),
+                    "regions": [region for region, _, _ in keys],
+                    "lons": [longitude for _, longitude, _ in keys],
+                    "lats": [latitude for _, _, latitude in keys],
+                    "mode": mode,
+                    "time": time,
+                    "ttl": ISOCHRONE_TTL,
+                    "precision": COORDINATE_PRECISION,
+                },
+            ).fetchall()
+        except DBAPIError as e:
+            if not is_statement_timeout(e):
+                raise
+            rows = []
+
+    for row in rows:
+        isochrone = Isochrone(geojson=bytes(row.geojson), wkb=bytes(row.wkb))
+        region = keys[row.idx][0]
+        for i in indices[keys[row.idx]]:
+            results[i] = isochrone
+            record_isochrone_hit(region, row.id)
+    for isochrone in results:
+        record_cache_result("isochrone", isochrone is not None)
+    return results
+
+
+def lookup_isochrone(
+    engine: Engine,
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    time: int,
+) -> Optional[Isochrone]:
+    """
+    The isochrone without routing: from the cache, or derived from a stored
+    travel-time surface (and then cached). None if it has to be routed.
+    Cached rows hold the serialized GeoJSON and WKB, so hits need no conversion.
     """
     time_minutes = time / 60
-    point = Point(longitude, latitude)
+    longitude, latitude = snap_origin(longitude, latitude)
 
-    # Try to load from DB for caching
-    with timer("load_isochrone_from_db"):
+    # Try to load from DB for caching. Hits are counted in process for LRU
+    # eviction and written periodically, so lookups stay read-only.
+    # Rows cached before geojson/wkb were stored are converted from geom.
+    with timer("isochrone_cache_lookup"):
         with engine.connect() as conn:
+            apply_statement_timeout(conn)
             result = conn.execute(
                 text(
                     """
-                    SELECT ST_AsGeoJSON(geom) AS geojson
+                    SELECT
+                        id,
+                        COALESCE(
+                            geojson,
+                            convert_to(ST_AsGeoJSON(geom, :precision), 'UTF8')
+                        ) AS geojson,
+                        COALESCE(wkb, ST_AsBinary(geom)) AS wkb
                     FROM isochrones
                     WHERE
-                        mode = :mode
+                        region = :region
+                        AND mode = :mode
                         AND time_seconds = :time
                         AND ST_Equals(
                             origin,
                             ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)
                         )
                         AND created_at >= now() - INTERVAL :ttl
-                    LIMIT 1
                 """
                 ),
                 {
+                    "region": region,
                     "mode": mode,
                     "time": time,
                     "lon": longitude,
                     "lat": latitude,
                     "ttl": ISOCHRONE_TTL,
+                    "precision": COORDINATE_PRECISION,
                 },
             ).fetchone()
 
-            if result:
-                return json.loads(result.geojson)
-
-    # Calculate, if not existing.
-    with timer("load_transport_network"):
-        network = load_transport_network("muenster")
+    record_cache_result("isochrone", result is not None)
+    if result:
+        record_isochrone_hit(region, result.id)
+        return Isochrone(geojson=bytes(result.geojson), wkb=bytes(result.wkb))
 
     # Sanity check that the time is not too short.
     if time_minutes < 1:
         logger.warning(f"Time is too short: {time_minutes} minutes")
-        geojson = {"type": "Polygon", "coordinates": []}
+        geojson = EMPTY_POLYGON
     else:
-        with timer("calculate_isochrone"):
-            try:
-                isochrones = Isochrones(
-                    transport_network=network,
-                    origins=point,
-                    isochrones=[time_minutes],
-                    point_grid_resolution=100,
-                    point_grid_sample_ratio=0.3,
-                    transport_modes=[MODE_TO_R5PY_TRANSPORT_MODE[mode]],
-                )
-                # Create convex hull of destinations
-                multi_point = MultiPoint(isochrones.destinations.geometry)
-                hull = multi_point.convex_hull
-                # If empty geometry, return an empty geojson polygon.
-                if hull.is_empty:
-                    geojson = {"type": "Polygon", "coordinates": []}
-                else:
-                    geojson = mapping(hull)
-            except AttributeError:
-                # This usually occurs when it can't find the transport network.
-                # Return an empty geojson polygon.
-                geojson = {"type": "Polygon", "coordinates": []}
-
-    with timer("save_to_db"):
-        with engine.begin() as conn:
-            conn.execute(
-                text(
-                    """
-                    INSERT INTO isochrones (
-                        mode,
-                        time_seconds,
+        surface = find_surface(engine, region, mode, longitude, latitude, time)
+        if surface is None:
+            return None
+        with timer("hull"):
+            geojson = isochrone_from_surface(surface, time)
+
+    isochrone = Isochrone.from_geojson(geojson)
+    save_isochrone(engine, region, longitude, latitude, mode, time, isochrone)
+    return isochrone
+
+
+def route_isochrone(
+    engine: Engine,
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    time: int,
+) -> Isochrone:
+    """Route the origin's travel-time surface and cache the isochrone derived from it."""
+    longitude, latitude = snap_origin(longitude, latitude)
+    try:
+        surface = route_surface_once(
+            engine, region, longitude, latitude, mode, surface_max_time(time)
+        )
+    except AttributeError:
+        # This usually occurs when it can't find the transport network.
+        surface = None
+
+    if surface is None:
+        geojson = EMPTY_POLYGON
+    else:
+        with timer("hull"):
+            geojson = isochrone_from_surface(surface, time)
+
+    isochrone = Isochrone.from_geojson(geojson)
+    save_isochrone(engine, region, longitude, latitude, mode, time, isochrone)
+    return isochrone
+
+
+def get_isochrone(
+    engine: Engine,
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    time: int,
+) -> Isochrone:
+    """
+    Calculate the isochrone for a given longitude and latitude.
+    The isochrone is derived from the origin's travel-time surface, which is
+    routed once up to SURFACE_MAX_TIME_SECONDS and reused for other times.
+    Args:
+        engine: The database engine used for caching.
+        region: The region the point lies in.
+        longitude: The longitude of the point.
+        latitude: The latitude of the point.
+        mode: The mode of transport.
+        time: The time in seconds.
+    Returns:
+        The isochrone as GeoJSON bytes and WKB.
+    """
+    isochrone = lookup_isochrone(engine, region, longitude, latitude, mode, time)
+    if isochrone is not None:
+        return isochrone
+    check_deadline("routing")
+    return route_isochrone(engine, region, longitude, latitude, mode, time)
+
+
+def get_stale_isochrone(
+    engine: Engine,
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    time: int,
+) -> Optional[Isochrone]:
+    """A cached isochrone regardless of its age, or None."""
+    longitude, latitude = snap_origin(longitude, latitude)
+
+    with timer("isochrone_stale_lookup"), engine.begin() as conn:
+        apply_statement_timeout(conn)
+        result = conn.execute(
+            text(
+                """
+                SELECT
+                    COALESCE(
+                        geojson,
+                        convert_to(ST_AsGeoJSON(geom, :precision), 'UTF8')
+                    ) AS geojson,
+                    COALESCE(wkb, ST_AsBinary(geom)) AS wkb
+                FROM isochrones
+                WHERE
+                    region = :region
+                    AND mode = :mode
+                    AND time_seconds = :time
+                    AND ST_Equals(
                         origin,
-                        geom,
-                        created_at
-                    )
-                    VALUES (
-                        :mode,
-                        :time,
-                        ST_SetSRID(ST_MakePoint(:lon, :lat), 4326),
-                        ST_SetSRID(ST_GeomFromGeoJSON(:geom), 4326),
-                        now()
+                        ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)
                     )
-                    ON CONFLICT (mode, time_seconds, origin)
-                    DO UPDATE SET
-                        geom = EXCLUDED.geom,
-                        created_at = now()
                 """
-                ),
-                {
-                    "mode": mode,
-                    "time": time,
-                    "lon": longitude,
-                    "lat": latitude,
-                    "geom": json.dumps(geojson),
-                },
+            ),
+            {
+                "region": region,
+                "mode": mode,
+                "time": time,
+                "lon": longitude,
+                "lat": latitude,
+                "precision": COORDINATE_PRECISION,
+            },
+        ).fetchone()
+
+    if result is None:
+        return None
+    return Isochrone(geojson=bytes(result.geojson), wkb=bytes(result.wkb))
+
+
+def submit_isochrone(
+    engine: Engine,
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    time: int,
+) -> Future:
+    """
+    Run route_isochrone in the routing executor. A request for an isochrone
+    that is already being routed gets the running call's future instead of a
+    new thread. The call is shared, so it runs outside any request's context:
+    no deadline cuts it short, and each waiter applies its own.
+    """
+    key = (region, mode, *snap_origin(longitude, latitude), time)
+    with _calls_lock:
+        future = _isochrone_calls.get(key)
+        if future is not None:
+            return future
+        future = _isochrone_calls[key] = _routing_executor.submit(
+            contextvars.Context().run,
+            route_isochrone,
+            engine,
+            region,
+            longitude,
+            latitude,
+            mode,
+            time,
+        )
+
+    def forget(done: Future):
+        with _calls_lock:
+            if _isochrone_calls.get(key) is done:
+                del _isochrone_calls[key]
+
+    future.add_done_callback(forget)
+    return future
+
+
+async def get_isochrone_within_deadline(
+    engine: Engine,
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    time: int,
+) -> Isochrone:
+    """
+    get_isochrone, bounded by the request deadline minus DEADLINE_RESERVE_SECONDS.
+    The cache lookup runs right away; only routing waits for the routing
+    executor. If time runs out, a stale cached isochrone or else the speed-based
+    approximation is returned and the request is marked as degraded. A routing
+    run that already started cannot be interrupted; it finishes in its thread
+    and fills the cache.
+    """
+    try:
+        timeout = remaining(reserve=DEADLINE_RESERVE_SECONDS)
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceeded("No time left for the isochrone")
+        isochrone = await asyncio.wait_for(
+            asyncio.to_thread(
+                lookup_isochrone, engine, region, longitude, latitude, mode, time
+            ),
+            timeout,
+        )
+        if isochrone is not None:
+            return isochrone
+
+        timeout = remaining(reserve=DEADLINE_RESERVE_SECONDS)
+        if timeout is not None and timeout <= 0:
+            raise DeadlineExceeded("No time left for routing")
+        future = submit_isochrone(engine, region, longitude, latitude, mode, time)
+        # Shielded: giving up must not cancel a call other requests wait for
+        with timer("routing_wait"):
+            return await asyncio.wait_for(
+                asyncio.shield(asyncio.wrap_future(future)), timeout
             )
+    except (asyncio.TimeoutError, DeadlineExceeded):
+        pass
+    except DBAPIError as e:
+        if not is_statement_timeout(e):
+            raise
 
-    return geojson
+    mark_degraded("isochrone")
+    left = remaining()
+    try:
+        stale = await asyncio.wait_for(
+            asyncio.to_thread(
+                get_stale_isochrone, engine, region, longitude, latitude, mode, time
+            ),
+            None if left is None else max(MIN_STATEMENT_TIMEOUT_SECONDS, left),
+        )
+    except asyncio.TimeoutError:
+        stale = None
+    except DBAPIError as e:
+        if not is_statement_timeout(e):
+            raise
+        stale = None
+    if stale is not None:
+        return stale
+    return Isochrone.from_geojson(
+        approximate_isochrone(region, longitude, latitude, mode, time)
+    )
+
+
+def calculate_isochrone(
+    engine: Engine,
+    region: str,
+    longitude: float,
+    latitude: float,
+    mode: Mode,
+    time: int,
+) -> GeoJSON:
+    """
+    Calculate the isochrone for a given longitude and latitude.
+    Returns a GeoJSON object with the isochrone polygon (see get_isochrone).
+    """
+    return get_isochrone(engine, region, longitude, latitude, mode, time).to_geojson()
 
 
 if __name__ == "__main__":
     import json
+    from sqlalchemy import create_engine
 
     # Example test values
+    test_region = "muenster"
     test_longitude = 7.625  # Münster city center longitude
     test_latitude = 51.962  # Münster city center latitude
     test_mode: Mode = "walk"  # can be "walk", "bike", or "car"
@@ -199,6 +766,8 @@ if __name__ == "__main__":
 
     try:
         geojson_polygon = calculate_isochrone(
+            engine=create_engine(os.getenv("DATABASE_URL")),
+            region=test_region,
             longitude=test_longitude,
             latitude=test_latitude,
             mode=test_mode,
@@ -0,0 +1,144 @@
+import logging
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+
+import geojson
+import pyproj
+from pyproj.aoi import AreaOfInterest
+from pyproj.database import query_utm_crs_info
+import shapely
+import toml
+from shapely.geometry import shape, MultiPolygon, Polygon
+from shapely.geometry.base import BaseGeometry
+from shapely.ops import transform
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).parent.parent
+DATA_DIR = BASE_DIR / "data"
+REGIONS_FILE = BASE_DIR / "regions.toml"
+
+TARGET_CRS = pyproj.CRS("EPSG:4326")
+
+# Region keys are used in table partition names, so keep them identifier-safe
+REGION_KEY_PATTERN = re.compile(r"^[a-z][a-z0-9_]*$")
+
+
+@dataclass(frozen=True)
+class Region:
+    key: str
+    name: str
+    download_url: str
+    boundary_file: str
+    boundary_crs: str = "EPSG:4326"
+    # (min_lon, min_lat, max_lon, max_lat): fast pre-filter for routing, and
+    # used on its own when the boundary file has not been downloaded
+    bbox: Optional[tuple[float, float, float, float]] = None
+
+    def in_bbox(self, longitude: float, latitude: float) -> bool:
+        if self.bbox is None:
+            return True
+        min_lon, min_lat, max_lon, max_lat = self.bbox
+        return min_lon <= longitude <= max_lon and min_lat <= latitude <= max_lat
+
+    @property
+    def data_dir(self) -> Path:
+        return DATA_DIR / self.key
+
+    @property
+    def boundary_path(self) -> Path:
+        return self.data_dir / self.boundary_file
+
+    def find_pbf(self) -> Optional[Path]:
+        """The first .osm.pbf file in the region's data directory, if any."""
+        files = sorted(self.data_dir.glob("*.osm.pbf"))
+        return files[0] if files else None
+
+
+@lru_cache(maxsize=1)
+def load_regions() -> dict[str, Region]:
+    """
+    Load the region registry from regions.toml.
+    Returns: { region_key: Region }
+    """
+    config = toml.load(REGIONS_FILE)
+    regions = {}
+
+    for key, cfg in config.items():
+        if not REGION_KEY_PATTERN.match(key):
+            raise ValueError(f"Invalid region key '{key}' in {REGIONS_FILE.name}")
+        if "bbox" in cfg:
+            cfg["bbox"] = tuple(cfg["bbox"])
+        regions[key] = Region(key=key, **cfg)
+
+    return regions
+
+
+def get_region(key: str) -> Region:
+    regions = load_regions()
+    if key not in regions:
+        raise KeyError(f"Unknown region '{key}'")
+    return regions[key]
+
+
+@lru_cache(maxsize=None)
+def load_boundary(key: str) -> BaseGeometry:
+    """
+    Load the administrative boundary of a region, reprojected to EPSG:4326.
+    """
+    region = get_region(key)
+    logger.info(f"Loading {region.name} boundary")
+
+    with open(region.boundary_path) as f:
+        boundary = geojson.load(f)
+
+    geometry = shape(boundary["features"][0]["geometry"])
+
+    source_crs = pyproj.CRS(region.boundary_crs)
+    if source_crs != TARGET_CRS:
+        transformer = pyproj.Transformer.from_crs(
+            source_crs, TARGET_CRS, always_xy=True
+        )
+        geometry = transform(transformer.transform, geometry)
+
+    # Speeds up the repeated point-in-polygon tests in region_for_point
+    shapely.prepare(geometry)
+    return geometry
+
+
+def utm_crs_for(longitude: float, latitude: float) -> pyproj.CRS:
+    """The UTM zone CRS of a point, used for planar distances within a region."""
+    utm_crs_list = query_utm_crs_info(
+        datum_name="WGS 84",
+        area_of_interest=AreaOfInterest(longitude, latitude, longitude, latitude),
+    )
+    return pyproj.CRS.from_epsg(utm_crs_list[0].code)
+
+
+def outer_polygon(geometry: BaseGeometry) -> Polygon:
+    """The largest polygon of a (multi)polygon boundary."""
+    if isinstance(geometry, MultiPolygon):
+        return max(geometry.geoms, key=lambda polygon: polygon.area)
+    return geometry
+
+
+def region_for_point(longitude: float, latitude: float) -> Optional[Region]:
+    """
+    Find the region whose boundary contains the given point.
+    Regions without a boundary file are matched by their bbox only.
+    """
+    point = shapely.Point(longitude, latitude)
+
+    for region in load_regions().values():
+        if not region.in_bbox(longitude, latitude):
+            continue
+        if region.boundary_path.exists():
+            if load_boundary(region.key).contains(point):
+                return region
+        elif region.bbox is not None:
+            return region
+
+    return None
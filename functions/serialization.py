@@ -0,0 +1,213 @@
+import gzip
+import hashlib
+import os
+import threading
+import zlib
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+import brotli
+import orjson
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+# Decimal places kept for lon/lat in responses (6 ≈ 0.1 m)
+COORDINATE_PRECISION = int(os.getenv("COORDINATE_PRECISION", "6"))
+# Responses smaller than this (bytes) are sent uncompressed
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+
+
+def round_coordinates(geojson: dict, precision: int = COORDINATE_PRECISION) -> dict:
+    """
+    Return a copy of a GeoJSON geometry with coordinates rounded to `precision` decimals.
+    """
+
+    def _round(value):
+        if isinstance(value, (list, tuple)):
+            return [_round(v) for v in value]
+        return round(value, precision)
+
+    rounded = dict(geojson)
+    rounded["coordinates"] = _round(geojson.get("coordinates", []))
+    return rounded
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def compute_etag(body: bytes) -> str:
+    """
+    A weak ETag of the uncompressed body: the identity, gzip and br
+    representations differ in bytes, which a strong validator must not cover.
+    """
+    return 'W/"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as If-None-Match requires
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+
+def accepted_encoding(request: Request) -> str | None:
+    """
+    Pick the best supported content encoding from the Accept-Encoding header.
+    Brotli is preferred over gzip as it compresses GeoJSON noticeably better.
+    """
+    accept = request.headers.get("accept-encoding", "")
+    encodings = {}
+    for part in accept.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        encodings[name.strip().lower()] = quality
+
+    for encoding in ("br", "gzip"):
+        if encodings.get(encoding, 0.0) > 0:
+            return encoding
+    return None
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL)
+
+
+def build_response(
+    request: Request,
+    body: bytes,
+    *,
+    etag: str | None = None,
+    media_type: str = "application/json",
+) -> Response:
+    """
+    Build a response from already serialized bytes.
+    Handles If-None-Match (when an ETag is given) and compression above
+    COMPRESSION_MIN_SIZE.
+    """
+    headers = {"Vary": "Accept-Encoding"}
+
+    if etag is not None:
+        headers["ETag"] = etag
+        if etag_matches(request, etag):
+            return Response(status_code=304, headers=headers)
+
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        encoding = accepted_encoding(request)
+        if encoding:
+            body = compress(body, encoding)
+            headers["Content-Encoding"] = encoding
+
+    return Response(content=body, media_type=media_type, headers=headers)
+
+
+def compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    """Incrementally compress a stream of chunks, flushing after each one."""
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        for chunk in chunks:
+            yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)  # 31: gzip header
+        for chunk in chunks:
+            yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that calls `on_close` once the response ends, also when
+    the client disconnects mid-stream (Starlette then skips background tasks).
+    A disconnect cancels the response while a worker thread may still be
+    reading the next chunk, so reading and closing share a lock: `on_close`
+    waits for that read instead of closing the source under it.
+    """
+
+    def __init__(self, content: Iterable[bytes], on_close: Callable[[], None], **kwargs):
+        self._lock = threading.Lock()
+        self._chunks = iter(content)
+        super().__init__(self._read_chunks(), **kwargs)
+        self.on_close = on_close
+
+    def _read_chunks(self) -> Iterator[bytes]:
+        while True:
+            with self._lock:
+                chunk = next(self._chunks, None)
+            if chunk is None:
+                return
+            yield chunk
+
+    def _close(self):
+        with self._lock:
+            self.on_close()
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            await run_in_threadpool(self._close)
+
+
+def build_streaming_response(
+    request: Request,
+    chunks: Iterable[bytes],
+    *,
+    media_type: str = "application/json",
+    on_close: Optional[Callable[[], None]] = None,
+) -> StreamingResponse:
+    """
+    Build a chunked response from an iterator of serialized chunks,
+    compressed on the fly if the client accepts it. `on_close` releases what
+    the chunks are read from (e.g. a database cursor) when the response ends.
+    """
+    headers = {"Vary": "Accept-Encoding"}
+
+    encoding = accepted_encoding(request)
+    if encoding:
+        chunks = compress_stream(chunks, encoding)
+        headers["Content-Encoding"] = encoding
+
+    if on_close is not None:
+        return ClosingStreamingResponse(
+            chunks, on_close, media_type=media_type, headers=headers
+        )
+    return StreamingResponse(chunks, media_type=media_type, headers=headers)
+
+
+def ndjson_chunks(batches: Iterable[list]) -> Iterator[bytes]:
+    """Serialize batches of items as newline-delimited JSON, one chunk per batch."""
+    for batch in batches:
+        if batch:
+            yield b"\n".join(dumps(item) for item in batch) + b"\n"
+
+
+def json_array_chunks(batches: Iterable[list]) -> Iterator[bytes]:
+    """Serialize batches of items as one JSON array, one chunk per batch."""
+    yield b"["
+    first = True
+    for batch in batches:
+        if not batch:
+            continue
+        chunk = dumps(batch)[1:-1]  # strip the brackets of the batch's own array
+        yield chunk if first else b"," + chunk
+        first = False
+    yield b"]"
+
+
+def sse_event(event: str, data: Any) -> bytes:
+    """Serialize one Server-Sent Event; orjson output never contains newlines."""
+    return b"event: " + event.encode() + b"\ndata: " + dumps(data) + b"\n\n"
@@ -0,0 +1,291 @@
+import os
+import threading
+import time as time_module
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+import pyproj
+from shapely import MultiPoint, Polygon
+from shapely.geometry import mapping
+from sqlalchemy import Engine, text
+
+from .cache import ISOCHRONE_TTL, ISOCHRONE_TTL_SECONDS, record_surface_hit
+from .deadline import apply_statement_timeout
+from .metrics import timer, record_cache_result
+from .regions import utm_crs_for
+from .serialization import round_coordinates
+
+# One routing run per origin and mode covers every time up to this maximum
+SURFACE_MAX_TIME_SECONDS = int(os.getenv("SURFACE_MAX_TIME_SECONDS", "1800"))
+# Travel-time surfaces kept in memory per process (least recently used out)
+SURFACE_CACHE_SIZE = int(os.getenv("SURFACE_CACHE_SIZE", "128"))
+
+# Straight-line speed upper bounds, used to size the destination grid
+MODE_MAX_SPEED_MPS = {
+    "walk": 5 / 3.6,
+    "bike": 20 / 3.6,
+    "car": 60 / 3.6,
+}
+POINT_GRID_RESOLUTION = 100  # meters, the finest grid used
+POINT_GRID_SAMPLE_RATIO = 0.3  # the lowest sample ratio used
+POINT_GRID_MAX_RESOLUTION = 500  # meters
+# Destinations routed per surface; the grid is made coarser for larger
+# reachable areas so routing time stops growing with mode speed x time
+# (0: always POINT_GRID_RESOLUTION and POINT_GRID_SAMPLE_RATIO)
+POINT_GRID_TARGET_DESTINATIONS = int(os.getenv("POINT_GRID_TARGET_DESTINATIONS", "20000"))
+
+# A surface: one record per reachable grid point, 10 bytes each when stored
+SURFACE_DTYPE = np.dtype([("lon", "<f4"), ("lat", "<f4"), ("time", "<u2")])
+
+EMPTY_POLYGON = {"type": "Polygon", "coordinates": []}
+
+# (region, mode, lon, lat) -> (max_time_seconds, created_at, surface);
+# created_at (time.time()) is when the surface was routed
+_surfaces: "OrderedDict[tuple, tuple[int, float, np.ndarray]]" = OrderedDict()
+_surfaces_lock = threading.Lock()
+
+
+def surface_max_time(time: int) -> int:
+    return max(SURFACE_MAX_TIME_SECONDS, time)
+
+
+def grid_parameters(
+    mode: str,
+    max_time_seconds: int,
+    target: int = POINT_GRID_TARGET_DESTINATIONS,
+) -> tuple[float, float]:
+    """
+    Resolution and sample ratio of the destination grid, so about `target`
+    destinations cover the area reachable at the mode's maximum speed.
+    Small areas are sampled more densely (up to every point of the finest
+    grid); large ones first get the lowest sample ratio, then a coarser grid.
+    """
+    if target <= 0:
+        return POINT_GRID_RESOLUTION, POINT_GRID_SAMPLE_RATIO
+
+    area = np.pi * (MODE_MAX_SPEED_MPS[mode] * max_time_seconds) ** 2
+    sample_ratio = target * POINT_GRID_RESOLUTION**2 / area
+    if sample_ratio >= POINT_GRID_SAMPLE_RATIO:
+        return POINT_GRID_RESOLUTION, min(1.0, sample_ratio)
+
+    resolution = np.sqrt(area * POINT_GRID_SAMPLE_RATIO / target)
+    # Whole 10 m steps, so nearby times share a grid
+    resolution = min(POINT_GRID_MAX_RESOLUTION, float(np.ceil(resolution / 10) * 10))
+    return resolution, POINT_GRID_SAMPLE_RATIO
+
+
+def build_destination_grid(
+    longitude: float,
+    latitude: float,
+    mode: str,
+    max_time_seconds: int,
+    resolution: Optional[float] = None,
+    sample_ratio: Optional[float] = None,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Regular grid of destinations (lon, lat) within the distance reachable at the
+    mode's maximum speed, randomly thinned to sample_ratio. Resolution and
+    sample ratio default to grid_parameters().
+    """
+    default_resolution, default_sample_ratio = grid_parameters(mode, max_time_seconds)
+    resolution = resolution or default_resolution
+    sample_ratio = sample_ratio or default_sample_ratio
+
+    crs = utm_crs_for(longitude, latitude)
+    to_utm = pyproj.Transformer.from_crs("EPSG:4326", crs, always_xy=True)
+    to_wgs84 = pyproj.Transformer.from_crs(crs, "EPSG:4326", always_xy=True)
+
+    cx, cy = to_utm.transform(longitude, latitude)
+    radius = MODE_MAX_SPEED_MPS[mode] * max_time_seconds
+    steps = np.arange(-radius, radius + resolution, resolution)
+    dx, dy = np.meshgrid(steps, steps)
+    inside = dx**2 + dy**2 <= radius**2
+    dx, dy = dx[inside], dy[inside]
+
+    if sample_ratio < 1:
+        # Fixed seed: the same origin always gets the same destinations
+        rng = np.random.default_rng(0)
+        keep = rng.random(dx.size) < sample_ratio
+        dx, dy = dx[keep], dy[keep]
+
+    return to_wgs84.transform(cx + dx, cy + dy)
+
+
+def make_surface(lon, lat, travel_time_seconds) -> np.ndarray:
+    surface = np.empty(len(lon), dtype=SURFACE_DTYPE)
+    surface["lon"] = lon
+    surface["lat"] = lat
+    surface["time"] = np.clip(travel_time_seconds, 0, np.iinfo(np.uint16).max)
+    return surface
+
+
+def isochrone_from_surface(surface: np.ndarray, time: int) -> dict:
+    """Convex hull of the surface points reachable within `time` seconds, as GeoJSON."""
+    reachable = surface[surface["time"] <= time]
+    if reachable.size < 3:
+        return EMPTY_POLYGON
+
+    points = np.column_stack(
+        (reachable["lon"].astype(np.float64), reachable["lat"].astype(np.float64))
+    )
+    hull = MultiPoint(points).convex_hull
+    if not isinstance(hull, Polygon) or hull.is_empty:
+        return EMPTY_POLYGON
+    return round_coordinates(mapping(hull))
+
+
+def get_cached_surface(
+    region: str, mode: str, longitude: float, latitude: float, time: int
+) -> Optional[np.ndarray]:
+    key = (region, mode, longitude, latitude)
+    with _surfaces_lock:
+        entry = _surfaces.get(key)
+        if entry is None:
+            return None
+        max_time_seconds, created_at, surface = entry
+        # Expires with the stored copy, which maintenance purges after the TTL
+        if time_module.time() - created_at > ISOCHRONE_TTL_SECONDS:
+            del _surfaces[key]
+            return None
+        if max_time_seconds < time:
+            return None
+        _surfaces.move_to_end(key)
+        return surface
+
+
+def cache_surface(
+    region: str,
+    mode: str,
+    longitude: float,
+    latitude: float,
+    max_time_seconds: int,
+    surface: np.ndarray,
+    created_at: Optional[float] = None,
+):
+    key = (region, mode, longitude, latitude)
+    if created_at is None:
+        created_at = time_module.time()
+    with _surfaces_lock:
+        _surfaces[key] = (max_time_seconds, created_at, surface)
+        _surfaces.move_to_end(key)
+        while len(_surfaces) > SURFACE_CACHE_SIZE:
+            _surfaces.popitem(last=False)
+
+
+def load_surface_from_db(
+    engine: Engine,
+    region: str,
+    mode: str,
+    longitude: float,
+    latitude: float,
+    time: int,
+    max_age: str = ISOCHRONE_TTL,
+) -> Optional[np.ndarray]:
+    """A stored surface covering `time`, not older than max_age (an interval), or None."""
+    with timer("surface_lookup"), engine.connect() as conn:
+        apply_statement_timeout(conn)
+        row = conn.execute(
+            text(
+                """
+                SELECT
+                    id,
+                    max_time_seconds,
+                    points,
+                    EXTRACT(EPOCH FROM created_at) AS created_at
+                FROM travel_time_surfaces
+                WHERE
+                    region = :region
+                    AND mode = :mode
+                    AND ST_Equals(
+                        origin,
+                        ST_SetSRID(ST_MakePoint(:lon, :lat), 4326)
+                    )
+                    AND max_time_seconds >= :time
+                    AND created_at >= now() - INTERVAL :max_age
+                """
+            ),
+            {
+                "region": region,
+                "mode": mode,
+                "lon": longitude,
+                "lat": latitude,
+                "time": time,
+                "max_age": max_age,
+            },
+        ).fetchone()
+
+    if row is None:
+        return None
+
+    # For least-recently-used eviction, written with the isochrone hits
+    record_surface_hit(region, row.id)
+    surface = np.frombuffer(row.points, dtype=SURFACE_DTYPE)
+    cache_surface(
+        region,
+        mode,
+        longitude,
+        latitude,
+        row.max_time_seconds,
+        surface,
+        created_at=float(row.created_at),
+    )
+    return surface
+
+
+def save_surface_to_db(
+    engine: Engine,
+    region: str,
+    mode: str,
+    longitude: float,
+    latitude: float,
+    max_time_seconds: int,
+    surface: np.ndarray,
+):
+    with timer("surface_save"), engine.begin() as conn:
+        conn.execute(
+            text(
+                """
+                INSERT INTO travel_time_surfaces (
+                    region,
+                    mode,
+                    origin,
+                    max_time_seconds,
+                    points,
+                    created_at
+                )
+                VALUES (
+                    :region,
+                    :mode,
+                    ST_SetSRID(ST_MakePoint(:lon, :lat), 4326),
+                    :max_time,
+                    :points,
+                    now()
+                )
+                ON CONFLICT (region, mode, origin)
+                DO UPDATE SET
+                    max_time_seconds = EXCLUDED.max_time_seconds,
+                    points = EXCLUDED.points,
+                    created_at = now()
+                """
+            ),
+            {
+                "region": region,
+                "mode": mode,
+                "lon": longitude,
+                "lat": latitude,
+                "max_time": max_time_seconds,
+                "points": surface.tobytes(),
+            },
+        )
+
+
+def find_surface(
+    engine: Engine, region: str, mode: str, longitude: float, latitude: float, time: int
+) -> Optional[np.ndarray]:
+    """A surface covering `time` from memory or the database, or None."""
+    surface = get_cached_surface(region, mode, longitude, latitude, time)
+    if surface is None:
+        surface = load_surface_from_db(engine, region, mode, longitude, latitude, time)
+    record_cache_result("surface", surface is not None)
+    return surface
@@ -0,0 +1,38 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from functions.cache import get_cache_stats, run_cache_maintenance
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+POSTGRES_CONNECTION_STRING = os.getenv("DATABASE_URL")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Purge expired isochrones and enforce the cache size cap."
+    )
+    parser.add_argument(
+        "--stats", action="store_true", help="Only print cache statistics"
+    )
+    args = parser.parse_args()
+
+    engine = create_engine(POSTGRES_CONNECTION_STRING)
+
+    if not args.stats:
+        run_cache_maintenance(engine)
+
+    print(json.dumps(get_cache_stats(engine), indent=2))
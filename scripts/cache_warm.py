@@ -0,0 +1,90 @@
+import argparse
+import json
+import logging
+import os
+import sys
+from dataclasses import asdict
+from pathlib import Path
+
+from dotenv import load_dotenv
+from sqlalchemy import create_engine
+
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from functions.regions import load_regions
+
+load_dotenv()
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+POSTGRES_CONNECTION_STRING = os.getenv("DATABASE_URL")
+
+
+if __name__ == "__main__":
+    regions = load_regions()
+
+    parser = argparse.ArgumentParser(
+        description="Precompute the isochrones of the most requested origins."
+    )
+    parser.add_argument(
+        "--region",
+        action="append",
+        choices=list(regions),
+        help="Region to warm (repeatable, default: all regions)",
+    )
+    parser.add_argument(
+        "--mode",
+        action="append",
+        choices=["walk", "bike", "car"],
+        help="Mode to warm (repeatable, default: all modes)",
+    )
+    parser.add_argument(
+        "--times",
+        help="Comma-separated isochrone times in seconds (default: CACHE_WARM_TIMES)",
+    )
+    parser.add_argument(
+        "--origins", type=int, help="Origins per region (default: CACHE_WARM_ORIGINS)"
+    )
+    parser.add_argument(
+        "--cpu-budget",
+        type=float,
+        help="Average CPU seconds per second, 0 for no limit (default: CACHE_WARM_CPU_BUDGET)",
+    )
+    parser.add_argument(
+        "--seeds", action="store_true", help="Only print the selected origins"
+    )
+    # Parsed before r5py is imported, which adds its own arguments to sys.argv
+    args = parser.parse_args()
+
+    from functions.cache_warmer import (
+        CACHE_WARM_CPU_BUDGET,
+        CACHE_WARM_ORIGINS,
+        CACHE_WARM_TIMES,
+        select_seeds,
+        warm_cache_exclusively,
+    )
+    from functions.reachability import MODES
+
+    engine = create_engine(POSTGRES_CONNECTION_STRING)
+    limit = args.origins if args.origins is not None else CACHE_WARM_ORIGINS
+
+    if args.seeds:
+        for key in args.region or list(regions):
+            for seed in select_seeds(engine, key, limit):
+                print(json.dumps(asdict(seed)))
+        sys.exit(0)
+
+    stats = warm_cache_exclusively(
+        engine,
+        regions=args.region,
+        modes=args.mode or MODES,
+        times=[int(t) for t in args.times.split(",")] if args.times else CACHE_WARM_TIMES,
+        limit=limit,
+        cpu_budget=args.cpu_budget if args.cpu_budget is not None else CACHE_WARM_CPU_BUDGET,
+    )
+    if stats is None:
+        logger.error("Another process is warming the cache")
+        sys.exit(1)
+    print(json.dumps(stats, indent=2))
@@ -5,6 +5,11 @@ import logging
 import psycopg2
 from dotenv import load_dotenv
 
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from functions.regions import load_regions
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -13,7 +18,23 @@ load_dotenv()
 POSTGRES_CONNECTION_STRING = os.getenv("DATABASE_URL")
 
 SQL_DIR = Path(__file__).parent / "sql"
-SQL_FILES = SQL_DIR.glob("*.sql")
+SQL_FILES = sorted(SQL_DIR.glob("*.sql"))
+
+# Tables partitioned by region (PARTITION BY LIST (region))
+PARTITIONED_TABLES = ["amenities", "isochrones", "travel_time_surfaces"]
+
+
+def create_region_partitions(cursor):
+    for region in load_regions().values():
+        for table in PARTITIONED_TABLES:
+            logger.info(f"Creating partition {table}_{region.key}")
+            cursor.execute(
+                f"""
+                CREATE TABLE IF NOT EXISTS {table}_{region.key}
+                PARTITION OF {table} FOR VALUES IN (%s)
+                """,
+                (region.key,),
+            )
 
 
 def create_schema():
@@ -23,6 +44,7 @@ def create_schema():
                 logger.info(f"Executing {sql_file}")
                 with open(sql_file, "r") as file:
                     cursor.execute(file.read())
+            create_region_partitions(cursor)
             conn.commit()
 
 
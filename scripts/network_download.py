@@ -0,0 +1,54 @@
+import argparse
+import logging
+import sys
+from pathlib import Path
+
+import httpx
+
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from functions.regions import Region, load_regions
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def download_network(region: Region, force: bool = False):
+    """Download the region's OSM extract into data/<region>/, unless one is present."""
+    region.data_dir.mkdir(parents=True, exist_ok=True)
+
+    if region.find_pbf() and not force:
+        logger.info(f".pbf file already present in {region.data_dir} — skipping download.")
+        return
+
+    target_file = region.data_dir / f"{region.key}.osm.pbf"
+    partial_file = target_file.with_suffix(".part")
+    logger.info(f"Downloading {region.download_url} to {target_file}")
+
+    with httpx.stream(
+        "GET", region.download_url, follow_redirects=True, timeout=60.0
+    ) as response:
+        response.raise_for_status()
+        with open(partial_file, "wb") as f:
+            for chunk in response.iter_bytes(chunk_size=1 << 20):
+                f.write(chunk)
+
+    partial_file.replace(target_file)
+
+
+if __name__ == "__main__":
+    regions = load_regions()
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--region",
+        action="append",
+        choices=list(regions),
+        help="Region to download (repeatable, default: all regions)",
+    )
+    parser.add_argument("--force", action="store_true", help="Download again")
+    args = parser.parse_args()
+
+    for key in args.region or list(regions):
+        download_network(regions[key], force=args.force)
@@ -0,0 +1,69 @@
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+root_dir = Path(__file__).parent.parent
+sys.path.append(str(root_dir))
+
+from functions.regions import load_regions
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+if __name__ == "__main__":
+    regions = load_regions()
+
+    parser = argparse.ArgumentParser(
+        description="Build the transport network of each region into the network cache."
+    )
+    parser.add_argument(
+        "--region",
+        action="append",
+        choices=list(regions),
+        help="Region to build (repeatable, default: all regions)",
+    )
+    parser.add_argument(
+        "--rebuild", action="store_true", help="Build again even if cached"
+    )
+    # Parsed before r5py is imported, which adds its own arguments to sys.argv
+    args = parser.parse_args()
+
+    from functions.graph_router import (
+        GRAPH_ROUTER_MODES,
+        graph_cache_path,
+        load_street_graph,
+        uses_graph_router,
+    )
+    from functions.network_cache import load_cached_network, network_cache_path
+
+    for key in args.region or list(regions):
+        pbf_file = regions[key].find_pbf()
+        if pbf_file is None:
+            logger.warning(f"No .osm.pbf file for region '{key}' — skipping.")
+            continue
+
+        if args.rebuild:
+            network_cache_path(key, pbf_file).unlink(missing_ok=True)
+
+        start = time.perf_counter()
+        load_cached_network(key, pbf_file)
+        if not network_cache_path(key, pbf_file).exists():
+            # Logged by load_cached_network; an image without it would build at startup
+            logger.error(f"Network of '{key}' could not be cached")
+            sys.exit(1)
+        logger.info(f"Network of '{key}' ready in {time.perf_counter() - start:.1f}s")
+
+        # Street graphs of the modes routed in-process
+        for mode in sorted(GRAPH_ROUTER_MODES):
+            if not uses_graph_router(mode):
+                continue
+            if args.rebuild:
+                graph_cache_path(key, pbf_file, mode).unlink(missing_ok=True)
+            start = time.perf_counter()
+            load_street_graph(key, mode)
+            logger.info(
+                f"{mode} street graph of '{key}' ready in {time.perf_counter() - start:.1f}s"
+            )
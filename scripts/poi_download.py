@@ -2,8 +2,6 @@ import argparse
 import asyncio
 import logging
 import os
-import geojson
-import pyproj
 from shapely.geometry import Polygon, Point
 from sqlalchemy import create_engine, Engine, text
 import geopandas as gpd
@@ -15,44 +13,18 @@ root_dir = Path(__file__).parent.parent
 sys.path.append(str(root_dir))
 
 from functions.poi import get_amenities_in_polygon
+from functions.regions import Region, load_regions, load_boundary, outer_polygon
+from functions.poi_snapshot import export_snapshot, get_snapshot
 from dotenv import load_dotenv
 
 load_dotenv()
 
-SOURCE_CRS = pyproj.CRS("EPSG:25832")
-TARGET_CRS = pyproj.CRS("EPSG:4326")
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 POSTGRES_CONNECTION_STRING = os.getenv("DATABASE_URL")
 
 
-def load_muenster_boundary() -> Polygon:
-    logger.info("Loading Münster boundary")
-
-    with open(
-        root_dir / "data" / "muenster" / "muenster_administrative_boundary.geojson"
-    ) as f:
-        boundary = geojson.load(f)
-
-    return Polygon(boundary["features"][0]["geometry"]["coordinates"][0][0])
-
-
-def reproject_polygon(polygon: Polygon) -> Polygon:
-    logger.info("Reprojecting boundary to EPSG:4326")
-
-    transformer = pyproj.Transformer.from_crs(
-        SOURCE_CRS, TARGET_CRS, always_xy=True
-    )
-
-    transformed_coords = [
-        transformer.transform(x, y) for x, y in polygon.exterior.coords
-    ]
-
-    return Polygon(transformed_coords)
-
-
 def polygon_to_overpass_string(polygon: Polygon) -> str:
     # Overpass expects "lat lon lat lon ..."
     return " ".join(
@@ -81,16 +53,18 @@ async def download_amenities(boundary: Polygon) -> list[dict]:
     ]
 
 
-def transfer_amenities_to_database(amenities: list[dict], engine: Engine):
-    logger.info("Transferring amenities to database")
+def transfer_amenities_to_database(
+    amenities: list[dict], engine: Engine, region: str
+):
+    logger.info(f"Transferring amenities of region '{region}' to database")
 
     df = gpd.GeoDataFrame(amenities, geometry="geometry", crs="EPSG:4326")
 
     upsert_sql = text(
         """
-        INSERT INTO amenities (id, geometry, name, amenity, cuisine)
-        VALUES (:id, ST_GeomFromText(:geom, 4326), :name, :amenity, :cuisine)
-        ON CONFLICT (id)
+        INSERT INTO amenities (region, id, geometry, name, amenity, cuisine)
+        VALUES (:region, :id, ST_GeomFromText(:geom, 4326), :name, :amenity, :cuisine)
+        ON CONFLICT (region, id)
         DO UPDATE SET
             geometry = EXCLUDED.geometry,
             name = EXCLUDED.name,
@@ -104,9 +78,11 @@ def transfer_amenities_to_database(amenities: list[dict], engine: Engine):
             conn.execute(
                 upsert_sql,
                 {
+                    "region": region,
                     "id": row.id,
                     "geom": row.geometry.wkt,
-                    "name": row.name,
+                    # row.name would be the Series' index label
+                    "name": row["name"],
                     "amenity": row.amenity,
                     "cuisine": row.cuisine,
                 },
@@ -115,26 +91,42 @@ def transfer_amenities_to_database(amenities: list[dict], engine: Engine):
     logger.info("Amenities transferred successfully")
 
 
-def has_amenities_data(engine: Engine) -> bool:
+def has_amenities_data(engine: Engine, region: str) -> bool:
     with engine.connect() as conn:
         return conn.execute(
-            text("SELECT EXISTS (SELECT 1 FROM amenities)")
+            text("SELECT EXISTS (SELECT 1 FROM amenities WHERE region = :region)"),
+            {"region": region},
         ).scalar()
 
 
+def download_region(region: Region, engine: Engine, update: bool):
+    if not update and has_amenities_data(engine, region.key):
+        logger.info(f"Amenities for {region.name} already present — skipping")
+        if get_snapshot(region.key) is None:
+            export_snapshot(engine, region.key)
+        return
+
+    boundary = outer_polygon(load_boundary(region.key))
+
+    amenities = asyncio.run(download_amenities(boundary))
+    transfer_amenities_to_database(amenities, engine, region.key)
+    export_snapshot(engine, region.key)
+
+
 if __name__ == "__main__":
+    regions = load_regions()
+
     parser = argparse.ArgumentParser()
     parser.add_argument("--update", action="store_true")
+    parser.add_argument(
+        "--region",
+        action="append",
+        choices=list(regions),
+        help="Region to download (repeatable, default: all regions)",
+    )
     args = parser.parse_args()
 
     engine = create_engine(POSTGRES_CONNECTION_STRING)
 
-    if not args.update and has_amenities_data(engine):
-        logger.info("Amenities already present — skipping")
-        sys.exit(0)
-
-    boundary = load_muenster_boundary()
-    boundary = reproject_polygon(boundary)
-
-    amenities = asyncio.run(download_amenities(boundary))
-    transfer_amenities_to_database(amenities, engine)
+    for key in args.region or list(regions):
+        download_region(regions[key], engine, args.update)
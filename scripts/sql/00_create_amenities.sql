@@ -1,13 +1,28 @@
 BEGIN;
 
+CREATE EXTENSION IF NOT EXISTS postgis;
+
+-- Before multi-region support the table was not partitioned. Amenities are
+-- re-downloaded by poi_download.py, so an old table is simply replaced.
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('amenities')) = 'r' THEN
+        DROP TABLE amenities;
+    END IF;
+END $$;
+
+-- One partition per region, created by create_schema.py from regions.toml
 CREATE TABLE IF NOT EXISTS amenities (
-    id BIGINT PRIMARY KEY,
+    region TEXT NOT NULL,
+    id BIGINT NOT NULL,
     geometry GEOMETRY(Point, 4326) NOT NULL,
     name TEXT,
     amenity TEXT,
-    cuisine TEXT
-);
+    cuisine TEXT,
+
+    PRIMARY KEY (region, id)
+) PARTITION BY LIST (region);
 
 CREATE INDEX IF NOT EXISTS idx_amenities_geometry ON amenities USING GIST (geometry);
 
-COMMIT;
\ No newline at end of file
+COMMIT;
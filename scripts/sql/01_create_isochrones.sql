@@ -2,8 +2,19 @@ BEGIN;
 
 CREATE EXTENSION IF NOT EXISTS postgis;
 
+-- Before multi-region support the table was not partitioned.
+-- It only holds cached isochrones, so an old table is simply replaced.
+DO $$
+BEGIN
+    IF (SELECT relkind FROM pg_class WHERE oid = to_regclass('isochrones')) = 'r' THEN
+        DROP TABLE isochrones;
+    END IF;
+END $$;
+
+-- One partition per region, created by create_schema.py from regions.toml
 CREATE TABLE IF NOT EXISTS isochrones (
-    id BIGSERIAL PRIMARY KEY,
+    region TEXT NOT NULL,
+    id BIGSERIAL,
 
     mode TEXT NOT NULL,
     time_seconds INTEGER NOT NULL,
@@ -13,9 +24,11 @@ CREATE TABLE IF NOT EXISTS isochrones (
 
     created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
 
+    PRIMARY KEY (region, id),
+
     CONSTRAINT isochrones_unique
-        UNIQUE (mode, time_seconds, origin)
-);
+        UNIQUE (region, mode, time_seconds, origin)
+) PARTITION BY LIST (region);
 
 CREATE INDEX IF NOT EXISTS idx_isochrones_origin
     ON isochrones
@@ -29,4 +42,4 @@ CREATE INDEX IF NOT EXISTS idx_isochrones_created_at
     ON isochrones (created_at);
 
 
-COMMIT;
\ No newline at end of file
+COMMIT;
@@ -0,0 +1,10 @@
+BEGIN;
+
+-- Hit tracking for least-recently-used eviction of cached isochrones
+ALTER TABLE isochrones ADD COLUMN IF NOT EXISTS last_hit_at TIMESTAMPTZ;
+ALTER TABLE isochrones ADD COLUMN IF NOT EXISTS hit_count BIGINT NOT NULL DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_isochrones_last_used
+    ON isochrones ((COALESCE(last_hit_at, created_at)));
+
+COMMIT;
@@ -0,0 +1,34 @@
+BEGIN;
+
+-- Travel times from one origin to a grid of destinations, routed once per
+-- origin and mode. Isochrones for any time up to max_time_seconds are
+-- derived from the stored points without routing again.
+-- One partition per region, created by create_schema.py from regions.toml
+CREATE TABLE IF NOT EXISTS travel_time_surfaces (
+    region TEXT NOT NULL,
+    id BIGSERIAL,
+
+    mode TEXT NOT NULL,
+    origin GEOMETRY(Point, 4326) NOT NULL,
+    max_time_seconds INTEGER NOT NULL,
+
+    -- packed (lon float32, lat float32, time uint16) records, little endian
+    points BYTEA NOT NULL,
+
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+    PRIMARY KEY (region, id),
+
+    CONSTRAINT travel_time_surfaces_unique
+        UNIQUE (region, mode, origin)
+) PARTITION BY LIST (region);
+
+CREATE INDEX IF NOT EXISTS idx_travel_time_surfaces_origin
+    ON travel_time_surfaces
+    USING GIST (origin);
+
+CREATE INDEX IF NOT EXISTS idx_travel_time_surfaces_created_at
+    ON travel_time_surfaces (created_at);
+
+
+COMMIT;
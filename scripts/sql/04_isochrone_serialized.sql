@@ -0,0 +1,9 @@
+BEGIN;
+
+-- The isochrone as served: precision-reduced GeoJSON bytes, and WKB for shapely.
+-- Cache hits return these without converting geom. Rows cached before have
+-- NULLs and are converted from geom on read until they expire.
+ALTER TABLE isochrones ADD COLUMN IF NOT EXISTS geojson BYTEA;
+ALTER TABLE isochrones ADD COLUMN IF NOT EXISTS wkb BYTEA;
+
+COMMIT;
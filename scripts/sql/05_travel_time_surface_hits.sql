@@ -0,0 +1,10 @@
+BEGIN;
+
+-- Least-recently-used eviction of stored travel-time surfaces above
+-- SURFACE_MAX_ROWS, like the isochrone cache
+ALTER TABLE travel_time_surfaces ADD COLUMN IF NOT EXISTS last_hit_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_travel_time_surfaces_last_used
+    ON travel_time_surfaces ((COALESCE(last_hit_at, created_at)));
+
+COMMIT;